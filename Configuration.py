@@ -29,6 +29,22 @@ STOCASTIC_AGENT = False  # An agent is stochastic if its movements and rotations
 ##########################################################
 MAX_ITER = 200
 
+# Depth views of visited states are stored as millimeters ('uint16') or as half precision meters ('float16')
+STATE_DEPTH_UINT16 = 'uint16'
+STATE_DEPTH_FLOAT16 = 'float16'
+STATE_DEPTH_DTYPE = STATE_DEPTH_UINT16
+STATE_FRAMES_ON_DISK = False  # Store the depth views of visited states into memory mapped temporary files
+
+# Execute a 'Pass' step after each action to sync the unity window frame. It does not change the simulator state,
+# hence it can be disabled when running headless to halve the simulator round trips.
+FRAME_SYNC = True
+
+# Perceive the environment while a worker thread executes the simulator frame sync step and the next move of the path
+# being followed, if any. A pipelined move which differs from the planned action (e.g. after a new PDDL plan) is kept,
+# and the path is planned again. Moves are not pipelined after collisions, non navigation actions and before the goal
+# check, where the agent falls back to serial mode.
+PIPELINED_PERCEPTION = False
+
 
 ##########################################################
 ############## ITHOR SIMULATOR CONFIGURATION #############
@@ -95,6 +111,9 @@ MAP_Y_MAX = 10000 * MOVE_STEP
 MAP_GRID_DX = MOVE_STEP*100
 MAP_GRID_DY = MOVE_STEP*100
 
+# Minimum number of depth points within a grid cell to consider the cell as an obstacle
+MAP_OCCUPANCY_THRSH = 10
+
 CAMERA_HEIGHT = None  # This is set runtime depending on the agent mode ('default' for ithor or 'locobot' for robothor)
 
 
@@ -106,6 +125,15 @@ IOU_THRSH = 0.8  # If the IoU between two objects is lower than the IoU threshol
 IRRELEVANT_CLASSES = ['floor', 'wall', 'roomdecor']
 OBJ_COUNT_THRSH = 2  # minimum number of an object observation to consider it a really existing object
 
+# Reuse the object detector predictions of a frame observed from a close pose (e.g. after a collision or a rotation
+# loop), if the perceptual hashes of the cached and new frames are close. The cache is cleared after every successful
+# manipulation, since the frame hash may not change when a small object is picked up, put down, opened or closed.
+DETECTION_CACHE = False
+DETECTION_CACHE_SIZE = 200  # Maximum number of cached frame predictions, the least recently used ones are evicted
+DETECTION_CACHE_POSITION_TOLERANCE = 0.05  # meters, maximum distance between the cached and new agent positions
+DETECTION_CACHE_ANGLE_TOLERANCE = 5  # degrees, maximum difference of both agent rotation and camera horizon
+DETECTION_CACHE_HASH_TOLERANCE = 2  # maximum number of different bits between the 64 bits hashes of two frames
+
 ##########################################################
 ############### PATH PLANNER CONFIGURATION ###############
 ##########################################################
@@ -116,14 +144,42 @@ MAX_USELESS_GOAL_CELLS = int(150 / MAP_GRID_DX)  # Useless goal cells cover 1.5
 
 DIAGONAL_MOVE = False  # Automatically set to True for object goal navigation
 
+# Grid search algorithm of the single goal path planner (PathPlanner.path_planning()). Both algorithms compute shortest
+# paths, however they may choose different paths with the same length. BFS answers from the distance field shared by
+# all goal checks against the same map, A* expands only the cells towards the goal, e.g. when the map changes often.
+PATH_SEARCH_BFS = 'bfs'
+PATH_SEARCH_ASTAR = 'astar'
+PATH_SEARCH = PATH_SEARCH_BFS
+
+# Exploration goals are chosen among frontiers, i.e., known free cells adjacent to unknown ones, rather than randomly.
+# Random goals are still sampled when no frontier is reachable.
+FRONTIER_EXPLORATION = True
+FRONTIER_MIN_SIZE = 3  # Frontiers with fewer grid cells are ignored
+FRONTIER_MIN_DISTANCE = 4  # Frontiers closer than the minimum number of moves from the agent are ignored
+
 
 ##########################################################
 ################# PREDICATE CLASSIFIERS ##################
 ##########################################################
 OBJ_DETECTOR_PATH = "Utils/pretrained_models/faster-rcnn_118classes.pkl"
+OBJ_DETECTOR_ROBOTHOR_OGN_PATH = "Utils/pretrained_models/faster-rcnn_12classes.pth"
 OPEN_CLASSIFIER_PATH = "Utils/pretrained_models/open_predictor.pth"
 ON_CLASSIFIER_PATH = "Utils/pretrained_models/on_predictor.pth"
 OBJ_CLASSES_PATH = "Utils/pretrained_models/obj_classes_coco.pkl"
+OPEN_CLASSIFIER_ROI_PATH = "Utils/pretrained_models/open_predictor_roi.pth"
+
+# Classify the "open(object)" predicate from the object detector backbone features pooled within the object bbox,
+# rather than running the open classifier backbone on the object image. This requires the open classifier head trained
+# on the object detector features (see OPEN_CLASSIFIER_ROI_PATH), which is trained by train_open_classifier_roi.py.
+SHARED_BACKBONE = False
+
+# Object detector inference backend. The TorchScript and ONNX Runtime models are exported from the fine-tuned
+# checkpoints by export_object_detector.py. Quantized models have int8 linear layers and run on CPU only.
+OBJ_DETECTOR_BACKEND_EAGER = 'eager'
+OBJ_DETECTOR_BACKEND_TORCHSCRIPT = 'torchscript'
+OBJ_DETECTOR_BACKEND_ONNX = 'onnx'
+OBJ_DETECTOR_BACKEND = OBJ_DETECTOR_BACKEND_EAGER
+OBJ_DETECTOR_QUANTIZED = False
 
 
 
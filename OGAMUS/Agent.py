@@ -4,6 +4,7 @@
 # LICENSE file in the root directory of this source tree.
 
 
+import concurrent.futures
 import copy
 import datetime
 import os
@@ -20,14 +21,14 @@ from OGAMUS.Plan.EventPlanner import EventPlanner
 from Utils import Logger, PddlParser
 from Utils.Evaluator import Evaluator
 
-import matplotlib.pyplot as plt
 
 class Agent:
 
 
     def __init__(self, scene="FloorPlan_Train1_1", position=None, init_rotation=None, init_horizon=None, shortest_path=None, controller=None):
 
-        # Set learner
+        # Set learner, the neural network models are loaded once per process and shared by all episodes
+        setup_start = datetime.datetime.now()
         self.learner = Learner()
 
         # Set event planner
@@ -128,7 +129,7 @@ class Agent:
         self.init_angle = self.event.metadata['agent']['rotation']['y']
 
         # Perceive the environment
-        perceptions = self.perceive()
+        perceptions, rgb_img, depth_img = self.perceive()
 
         # Update agent position in agent state and path planner state
         self.pos = {"x": int(), "y": int(), "z": int()}
@@ -151,11 +152,21 @@ class Agent:
         self.last_action_effects = None
 
         # Initialize initial state
-        self.state = self.create_state(perceptions)
+        self.state = self.create_state(perceptions, rgb_img, depth_img)
         self.learner.add_state(self.state)
 
         # Create evaluator of agent belief state
         self.evaluator = Evaluator()
+        setup_end = datetime.datetime.now()
+        Logger.write("Episode setup time: {:.2f} seconds".format((setup_end - setup_start).total_seconds()))
+
+        # Worker thread executing simulator steps while the agent perceives the environment, i.e., the frame sync
+        # step and the next move of the followed path (see get_pipelined_move()), and the pending steps
+        self.simulator_executor = None
+        self.sync_step = None
+        self.pipelined_move = None
+        if Configuration.PIPELINED_PERCEPTION:
+            self.simulator_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
 
         self.goal_achieved = False
         self.update()
@@ -214,13 +225,28 @@ class Agent:
                                                             or Configuration.TASK == Configuration.TASK_OGN_ITHOR):
                 event_action = "Stop"
 
+            # The next path move has already been executed if it has been pipelined with the previous perception. If
+            # the planned action differs, e.g. after a new PDDL plan, the executed move is kept and the path is
+            # planned again from the reached pose.
+            if self.pipelined_move is not None and self.pipelined_move[0] != event_action:
+                Logger.write("Pipelined move {} differs from the planned action {}, planning the path again"
+                             .format(self.pipelined_move[0], event_action))
+                event_action = self.pipelined_move[0]
+                self.event_planner.path_plan = None
+                self.event_planner.event_plan = None
+
             # DEBUG
             Logger.write('{}:{}'.format(self.iter + 1, event_action))
 
             # Execute the chosen action
             self.event = self.step(event_action)
             # Necessary to sync unity window frame, otherwise it shows one step before (but executes in the simulator)
-            self.controller.step("Pass")
+            if Configuration.FRAME_SYNC and self.simulator_executor is not None:
+                # The frame sync step does not change the simulator state and the agent perceives the environment
+                # from the chosen action event, hence the simulator can execute it while the agent perceives.
+                self.sync_step = self.simulator_executor.submit(self.controller.step, "Pass")
+            elif Configuration.FRAME_SYNC:
+                self.controller.step("Pass")
 
             # Detect collision when moving forward (and eventually update occupancy map)
             if event_action == "MoveAhead" and not self.event.metadata["lastActionSuccess"]:
@@ -309,32 +335,33 @@ class Agent:
             if Configuration.PRINT_CAMERA_DEPTH_VIEW_IMAGES:
                 Logger.save_img("depth_view_{}.png".format(i), (self.event.depth_frame/np.max(self.event.depth_frame)*255).astype('uint8'))
 
+            # Execute the next move of the followed path while perceiving the environment, after the frame sync step
+            # (if any) since the worker thread executes one simulator step at a time
+            if self.simulator_executor is not None:
+                pipelined_move = self.get_pipelined_move(event_action, n_iter)
+                if pipelined_move is not None:
+                    self.pipelined_move = (pipelined_move,
+                                           self.simulator_executor.submit(self.execute_move, pipelined_move))
+
             # Perceive the environment
-            perceptions = self.perceive()
+            perceptions, rgb_img, depth_img = self.perceive()
 
             # Check if the current state has already been visited
-            all_states_perceptions = np.array([state.perceptions[8 + Configuration.FRAME_WIDTH*Configuration.FRAME_HEIGHT*3:]
-                                               for state in self.learner.abstract_model.states])
-            all_states_diff = np.sum(all_states_perceptions -
-                                     perceptions[8 + Configuration.FRAME_WIDTH*Configuration.FRAME_HEIGHT*3:], axis=1)
-            candidate_states = [i for i, state in enumerate(all_states_diff) if state == 0]
+            candidate_states = self.learner.abstract_model.get_visited_states(depth_img)
 
             assert len(candidate_states) <= 1, 'There are more future possible states already visited, check Agent.py'
 
             if len(candidate_states) == 0:
-                new_state = self.create_state(perceptions)
+                new_state = self.create_state(perceptions, rgb_img, depth_img)
                 # Add state in abstract model
                 self.learner.add_state(new_state)
             else:
                 # DEBUG
                 # print('Coming back to state:{}'.format(candidate_states[0]))
 
-                new_state = self.learner.abstract_model.states[candidate_states[0]]
+                new_state = candidate_states[0]
 
                 # Get visible object relationships and update predicates
-                rgb_img = perceptions[8:8 + Configuration.FRAME_WIDTH * Configuration.FRAME_HEIGHT * 3] \
-                    .reshape((Configuration.FRAME_HEIGHT, Configuration.FRAME_WIDTH, 3)) \
-                    .astype(np.uint8)
                 self.update_predicates(new_state.visible_objects, rgb_img)
 
                 # Update objects bbox in knowledge manager
@@ -377,6 +404,12 @@ class Agent:
             if len(self.path) == 0 or self.pos != self.path[-1]:
                 self.path.append(copy.deepcopy(self.pos))
 
+        # Wait for the simulator before evaluating metrics
+        self.wait_sync_step()
+        if self.simulator_executor is not None:
+            self.simulator_executor.shutdown()
+            self.simulator_executor = None
+
         # Evaluate metrics
         self.evaluator.evaluate_state(self)
 
@@ -398,24 +431,82 @@ class Agent:
         # DEBUG
         end = datetime.datetime.now()
         Logger.write("Episode computational time: {} seconds".format((end-start).seconds))
+        if self.learner.detection_cache is not None:
+            Logger.write("Object detection cache hits: {}/{} ({:.2f}%)"
+                         .format(self.learner.detection_cache.hits, self.learner.detection_cache.lookups,
+                                 self.learner.detection_cache.get_hit_rate() * 100))
 
         # Release resources
         # self.controller.stop()
         # print(self.path)
-        plt.close(self.event_planner.path_planner.map_model.fig)        
 
         return self.controller
 
 
+    def wait_sync_step(self):
+        # Wait for the pending frame sync step (if any), the simulator must execute one step at a time
+        if self.sync_step is not None:
+            self.sync_step.result()
+            self.sync_step = None
+
+
+    def get_pipelined_move(self, event_action, n_iter):
+        """
+        Get the next move of the path followed by the agent, which can be executed while the agent perceives the
+        environment since it has already been planned. The agent falls back to serial mode, i.e., no move is
+        pipelined, after a collision or a non navigation action, when the camera inclination is going to be adjusted,
+        and before the last step, where the goal achievement is checked.
+        :param event_action: last executed action
+        :param n_iter: maximum number of agent steps
+        :return: next path move, or None if the next action may depend on the perception results
+        """
+        if not (event_action == "MoveAhead" or event_action.startswith("Rotate")) \
+                or not self.event.metadata["lastActionSuccess"] or self.goal_achieved \
+                or self.iter + 2 >= min(n_iter, Configuration.MAX_ITER):
+            return None
+
+        # Camera inclination is adjusted before following the path (see run())
+        subgoal = self.event_planner.subgoal
+        if (self.event_planner.event_plan is None or subgoal is None or subgoal.lower().startswith("pickup")) \
+                and int(self.event.metadata['agent']['cameraHorizon']) != 0:
+            return None
+
+        # When exploring the path plan is followed, otherwise the subgoal event plan, whose last action is
+        # handled by the event planner (see EventPlanner.event_planning())
+        if subgoal is None:
+            plan = self.event_planner.path_plan
+            min_plan_length = 1
+        else:
+            plan = self.event_planner.event_plan
+            min_plan_length = 2
+        if plan is None or len(plan) < min_plan_length:
+            return None
+
+        if plan[0] == "MoveAhead" or plan[0].startswith("Rotate"):
+            return plan[0]
+        return None
+
+
+    def execute_move(self, action):
+        # Execute a navigation action, i.e., a move or a rotation, in the environment
+        if len(action.split("|")) > 1:
+            degrees = round(float(action.split("|")[1]), 1)
+            return self.controller.step(action=action.split("|")[0], degrees=degrees)
+        return self.controller.step(action=action)
+
+
     def step(self, action):
         action_result = None
 
-        if action.startswith("Rotate") or action.startswith("Look"):
-            if len(action.split("|")) > 1:
-                degrees = round(float(action.split("|")[1]), 1)
-                action_result = self.controller.step(action=action.split("|")[0], degrees=degrees)
-            else:
-                action_result = self.controller.step(action=action)
+        self.wait_sync_step()
+
+        if self.pipelined_move is not None:
+            # The move has been executed while perceiving the previous step (see run())
+            action_result = self.pipelined_move[1].result()
+            self.pipelined_move = None
+
+        elif action.startswith("Rotate") or action.startswith("Look"):
+            action_result = self.execute_move(action)
 
         elif action.startswith("OpenObject") or action.startswith("CloseObject"):
             # If xy camera coordinates are used to perform the action, i.e., are in the action name
@@ -508,7 +599,14 @@ class Agent:
 
         else:
             # Execute "move" action in the environment
-            action_result = self.controller.step(action=action)
+            action_result = self.execute_move(action)
+
+        # Cached object detector predictions do not reflect the scene state changed by a manipulation
+        if self.learner.detection_cache is not None and action_result is not None \
+                and action_result.metadata['lastActionSuccess'] \
+                and (action.startswith("PickupObject") or action.startswith("PutObject")
+                     or action.startswith("OpenObject") or action.startswith("CloseObject")):
+            self.learner.detection_cache.clear()
 
         self.learner.knowledge_manager.update_all_obj_position(action, action_result, self.event_planner.subgoal)
 
@@ -529,30 +627,20 @@ class Agent:
         hand_z_pos = self.event.metadata['heldObjectPose']['position']['y']
         angle = (360 - self.event.metadata['agent']['rotation']['y'] + 90) % 360
         camera_angle = self.event.metadata['agent']['cameraHorizon']  # tilt angle of the camera
-        rgb_img = self.event.frame
-        depth_img = self.event.depth_frame
-        perceptions = np.concatenate((np.array([x_pos, y_pos, camera_z_pos,
-                                                hand_x_pos, hand_y_pos, hand_z_pos,
-                                                angle, camera_angle]),
-                                      rgb_img.flatten(),
-                                      depth_img.flatten()), dtype=np.float32)
-        return perceptions
+        rgb_img = self.event.frame.astype(np.uint8)
+        depth_img = self.event.depth_frame.astype(np.float32)
+        perceptions = np.array([x_pos, y_pos, camera_z_pos,
+                                hand_x_pos, hand_y_pos, hand_z_pos,
+                                angle, camera_angle], dtype=np.float32)
+        return perceptions, rgb_img, depth_img
 
-    def create_state(self, perceptions):
+    def create_state(self, perceptions, rgb_img, depth_img):
 
         x_pos = perceptions[0]
         y_pos = perceptions[1]
         camera_z_pos = perceptions[2]
         angle = perceptions[6]
 
-        rgb_img = perceptions[8:8 + Configuration.FRAME_WIDTH*Configuration.FRAME_HEIGHT*3]\
-            .reshape((Configuration.FRAME_HEIGHT, Configuration.FRAME_WIDTH, 3))\
-            .astype(np.uint8)
-
-        depth_img = perceptions[8 + Configuration.FRAME_WIDTH*Configuration.FRAME_HEIGHT*3:]\
-            .reshape((Configuration.FRAME_HEIGHT, Configuration.FRAME_WIDTH))\
-            .astype(np.float32)
-
         agent_pos = {'x': x_pos, 'y': y_pos, 'z': camera_z_pos}
         visible_objects = self.learner.get_visible_objects(rgb_img, depth_img, agent_pos, angle, self.event)
 
@@ -574,7 +662,7 @@ class Agent:
             self.learner.knowledge_manager.update_pddl_state()
 
         # Create new state
-        s_new = State(len(self.learner.abstract_model.states), perceptions, visible_objects)
+        s_new = State(len(self.learner.abstract_model.states), perceptions, depth_img, visible_objects)
 
         return s_new
 
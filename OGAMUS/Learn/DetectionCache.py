@@ -0,0 +1,129 @@
+# Copyright (c) 2022, Leonardo Lamanna
+# All rights reserved.
+# This source code is licensed under the MIT-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+
+import math
+from collections import OrderedDict, defaultdict
+
+import cv2
+import numpy as np
+
+import Configuration
+
+
+class DetectionCache:
+    """
+    Least recently used cache of object detector predictions, keyed by the agent pose. A cached prediction is reused
+    only if it has been computed from a pose within the position and angle tolerances of the new one, and the
+    perceptual hash of the cached frame is close to the one of the new frame. The cache must be cleared whenever the
+    scene state changes (e.g. after a manipulation), since the frame hash cannot detect small changes.
+    """
+
+    def __init__(self):
+        # Cached predictions, i.e., entry key -> (pose, frame hash, predictions), sorted by last usage
+        self.predictions = OrderedDict()
+
+        # Entry keys indexed by their pose bin, whose size is the pose tolerance, hence poses within the tolerance
+        # of a given one are in the neighbouring bins of the pose one
+        self.bins = defaultdict(set)
+
+        self.n_entries = 0
+        self.hits = 0
+        self.lookups = 0
+
+
+    def get_pose(self, agent_pos, agent_angle, cam_angle):
+        return agent_pos['x'], agent_pos['y'], agent_angle % 360, cam_angle
+
+
+    def get_bin(self, pose):
+        position_step = Configuration.DETECTION_CACHE_POSITION_TOLERANCE
+        angle_step = Configuration.DETECTION_CACHE_ANGLE_TOLERANCE
+        return (math.floor(pose[0] / position_step),
+                math.floor(pose[1] / position_step),
+                math.floor(pose[2] / angle_step),
+                math.floor(pose[3] / angle_step))
+
+
+    def get_neighbour_bins(self, pose):
+        x_bin, y_bin, angle_bin, cam_bin = self.get_bin(pose)
+        n_angle_bins = int(math.ceil(360 / Configuration.DETECTION_CACHE_ANGLE_TOLERANCE))
+        return [(x_bin + i, y_bin + j, (angle_bin + k) % n_angle_bins, cam_bin + h)
+                for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1) for h in (-1, 0, 1)]
+
+
+    def is_close(self, pose, cached_pose):
+        angle_diff = abs(pose[2] - cached_pose[2]) % 360
+        return math.sqrt((pose[0] - cached_pose[0]) ** 2 + (pose[1] - cached_pose[1]) ** 2) \
+               <= Configuration.DETECTION_CACHE_POSITION_TOLERANCE \
+               and min(angle_diff, 360 - angle_diff) <= Configuration.DETECTION_CACHE_ANGLE_TOLERANCE \
+               and abs(pose[3] - cached_pose[3]) <= Configuration.DETECTION_CACHE_ANGLE_TOLERANCE
+
+
+    def get_frame_hash(self, rgb_img):
+        # Difference hash, i.e., 64 bits telling whether the brightness increases between adjacent cells of a 9x8 grid
+        gray_img = cv2.resize(cv2.cvtColor(rgb_img, cv2.COLOR_RGB2GRAY), (9, 8), interpolation=cv2.INTER_AREA)
+        return (gray_img[:, 1:] > gray_img[:, :-1]).flatten()
+
+
+    def get(self, agent_pos, agent_angle, cam_angle, rgb_img):
+        """
+        Get the cached object detector predictions of a frame observed from a close pose.
+        :param agent_pos: agent position dictionary with 'x' and 'y' keys
+        :param agent_angle: agent rotation in degrees
+        :param cam_angle: agent camera horizon in degrees
+        :param rgb_img: RGB frame
+        :return: cached predictions, or None if the frame has not been observed from a close pose
+        """
+        self.lookups += 1
+
+        pose = self.get_pose(agent_pos, agent_angle, cam_angle)
+        frame_hash = None
+        for pose_bin in self.get_neighbour_bins(pose):
+            for key in self.bins.get(pose_bin, ()):
+                cached_pose, cached_frame_hash, predictions = self.predictions[key]
+                if not self.is_close(pose, cached_pose):
+                    continue
+
+                if frame_hash is None:
+                    frame_hash = self.get_frame_hash(rgb_img)
+                if np.count_nonzero(cached_frame_hash != frame_hash) <= Configuration.DETECTION_CACHE_HASH_TOLERANCE:
+                    self.predictions.move_to_end(key)
+                    self.hits += 1
+
+                    # Predictions dictionary is copied since its values are replaced by the learner
+                    return dict(predictions)
+
+        return None
+
+
+    def add(self, agent_pos, agent_angle, cam_angle, rgb_img, predictions):
+        pose = self.get_pose(agent_pos, agent_angle, cam_angle)
+        key = self.n_entries
+        self.n_entries += 1
+
+        self.predictions[key] = (pose, self.get_frame_hash(rgb_img), dict(predictions))
+        self.bins[self.get_bin(pose)].add(key)
+
+        # Evict the least recently used predictions
+        if len(self.predictions) > Configuration.DETECTION_CACHE_SIZE:
+            evicted_key, (evicted_pose, _, _) = self.predictions.popitem(last=False)
+            self.remove_from_bin(evicted_key, evicted_pose)
+
+
+    def remove_from_bin(self, key, pose):
+        pose_bin = self.get_bin(pose)
+        self.bins[pose_bin].discard(key)
+        if len(self.bins[pose_bin]) == 0:
+            del self.bins[pose_bin]
+
+
+    def clear(self):
+        self.predictions.clear()
+        self.bins.clear()
+
+
+    def get_hit_rate(self):
+        return self.hits / self.lookups if self.lookups > 0 else 0.
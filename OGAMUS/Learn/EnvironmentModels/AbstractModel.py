@@ -6,15 +6,52 @@
 
 from collections import defaultdict
 
+import Configuration
+from OGAMUS.Learn.EnvironmentModels.FrameStore import FrameStore
+from OGAMUS.Learn.EnvironmentModels.State import get_depth_digest
+
+
 class AbstractModel:
 
     def __init__(self):
         self.states = []
         self.transitions = defaultdict(list)
 
+        # States indexed by the digest of their original depth view, which identifies an already visited state
+        self.states_index = defaultdict(list)
+
+        # States indexed by their visible object ids
+        self.objects_states = defaultdict(list)
+
+        # Store of state views on disk
+        self.frame_store = None
+        if Configuration.STATE_FRAMES_ON_DISK:
+            self.frame_store = FrameStore()
+
     def add_transition(self, state_src, action, state_dest):
         self.transitions[state_src.id, action] = state_dest.id
 
     def add_state(self, state_new):
+        if self.frame_store is not None:
+            state_new.depth, = self.frame_store.add(state_new.depth)
         self.states.append(state_new)
+        self.states_index[state_new.depth_digest].append(state_new)
+        [self.objects_states[obj['id']].append(state_new)
+         for obj_type in state_new.visible_objects.keys()
+         for obj in state_new.visible_objects[obj_type]]
+
+    def remove_object(self, obj_id):
+        obj_type = obj_id.split('_')[0]
+        for state in self.objects_states.pop(obj_id, []):
+            state.visible_objects[obj_type] = [obj for obj in state.visible_objects[obj_type] if obj['id'] != obj_id]
+
+    def get_visited_states(self, depth_img):
+        """
+        Get the states with the same depth view. States keep only their compressed depth view, hence the depth views
+        are not compared on an index hit: the SHA-1 digest of the original float32 depth view bytes stands in for the
+        exact equality check, since different depth views have the same digest with negligible probability only.
+        :param depth_img: depth view in meters
+        :return: list of visited states with the same depth view
+        """
+        return self.states_index.get(get_depth_digest(depth_img), [])
 
@@ -0,0 +1,43 @@
+# Copyright (c) 2022, Leonardo Lamanna
+# All rights reserved.
+# This source code is licensed under the MIT-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+
+import tempfile
+
+import numpy as np
+
+
+class FrameStore:
+    """
+    Store of agent views backed by memory mapped temporary files, views are loaded from disk only when accessed.
+    Views are stored in chunks of fixed size, hence the store grows without copying the already stored views.
+    """
+
+    def __init__(self, chunk_size=100):
+        self.chunk_size = chunk_size
+        self.chunks = []
+        self.size = 0
+
+    def add(self, *frames):
+        """
+        Store agent views, e.g. rgb and depth views of a state.
+        :param frames: numpy arrays, each argument position must always have the same shape and data type
+        :return: memory mapped views of the stored arrays
+        """
+        chunk_index, frame_index = divmod(self.size, self.chunk_size)
+
+        if chunk_index == len(self.chunks):
+            self.chunks.append([np.memmap(tempfile.TemporaryFile(), dtype=frame.dtype, mode='w+',
+                                          shape=(self.chunk_size,) + frame.shape)
+                                for frame in frames])
+
+        stored_frames = []
+        for chunk, frame in zip(self.chunks[chunk_index], frames):
+            chunk[frame_index] = frame
+            stored_frames.append(chunk[frame_index])
+
+        self.size += 1
+
+        return stored_frames
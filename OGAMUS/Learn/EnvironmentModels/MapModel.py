@@ -4,12 +4,9 @@
 # LICENSE file in the root directory of this source tree.
 
 
-import matplotlib.pyplot as plt
 import Configuration
 import numpy as np
 
-from PIL import Image
-
 
 class MapModel:
 
@@ -40,63 +37,82 @@ class MapModel:
         # y axis length on map (centimeters)
         self.y_axis_len = abs(self.y_max - self.y_min)
 
-        # self.fig, self.axes = plt.subplots(figsize=(30,30))  # 3000 x 3000 pixel
-        self.fig, self.axes = plt.subplots(figsize=(int(self.y_axis_len/100), # 1 is 100 pixel, 1 pixel is 1 centimeter
-                                                    int(self.x_axis_len/100)))
+        # Number of grid rows (y axis, from y max to y min as in an image) and columns (x axis)
+        self.grid_rows = int(round(self.y_axis_len / self.dy))
+        self.grid_cols = int(round(self.x_axis_len / self.dx))
+
+        # Number of depth occupancy points fallen into each grid cell. Counts saturate at the maximum uint16 value,
+        # hence the map memory is fixed regardless of the number of integrated frames.
+        self.occupancy_counts = np.zeros((self.grid_rows, self.grid_cols), dtype=np.uint16)
 
-        # Set figure window size
-        window_x = (int(self.x_min/100), int(self.x_max/100))
-        window_y = (int(self.y_min/100), int(self.y_max/100))
-        self.axes.set_xlim(window_x)
-        self.axes.set_ylim(window_y)
+        # Grid cells observed by the agent depth view or traversed by the agent, the other ones are unknown
+        self.observed_cells = np.zeros((self.grid_rows, self.grid_cols), dtype=bool)
 
         self.grid = None
 
 
-    def update_occupancy(self, occupancy_points, pos, angle, file_name, collision=False):
+    def update_occupancy(self, occupancy_points, pos, angle, file_name, collision=False, observed_points=None):
 
-        # Draw depth occupancy points
-        self.axes.plot(occupancy_points[:,0], occupancy_points[:,1], 'o', markerfacecolor='none',
-                       markeredgecolor='k', alpha=0.5, markersize=1)
+        # Bin depth occupancy points (in meters) into grid cells, then fold the frame hits into the occupancy counts.
+        # Occupancy points are not stored, hence they can be released by the caller.
+        if len(occupancy_points) > 0:
+            cols = np.floor((occupancy_points[:, 0] * 100 - self.x_min) / self.dx).astype(np.int64)
+            rows = np.floor((self.y_max - occupancy_points[:, 1] * 100) / self.dy).astype(np.int64)
+            in_map = (rows >= 0) & (rows < self.grid_rows) & (cols >= 0) & (cols < self.grid_cols)
+            frame_hits = np.bincount(rows[in_map] * self.grid_cols + cols[in_map],
+                                     minlength=self.grid_rows * self.grid_cols)
+            frame_hits = frame_hits.reshape(self.occupancy_counts.shape)
+            self.occupancy_counts[:] = np.minimum(self.occupancy_counts + frame_hits, np.iinfo(np.uint16).max)
+
+        # Mark the agent cell and the grid cells of all depth view points (e.g. floor ones) as observed
+        self.set_observed_cells(np.array([[pos['x'], pos['y']]]))
+        if observed_points is not None and len(observed_points) > 0:
+            self.set_observed_cells(observed_points)
 
         if collision:
-            self.print_top_view(pos, angle, file_name)
+            self.set_grid()
 
+            # Print agent top view map
+            if Configuration.PRINT_TOP_VIEW_IMAGES:
+                self.print_top_view(pos, angle, file_name)
 
-    def print_top_view(self, pos, angle, file_name):
 
-        # Draw agent arrow
-        agent_width = 0.2  # 20 centimeters
-        agent_arrow = self.axes.arrow(pos['x'], pos['y'],
-                        agent_width * np.cos(np.deg2rad(angle + 90)), agent_width * np.sin(np.deg2rad(angle + 90)),
-                        head_width=agent_width, head_length=agent_width, # 1.25 for aesthetic reason
-                        length_includes_head=True, fc="Red", ec="Red", alpha=0.9)
+    def set_observed_cells(self, points):
 
-        plt.gca().set_aspect('equal')
+        # Bin points (in meters) into grid cells as done for occupancy points
+        cols = np.floor((points[:, 0] * 100 - self.x_min) / self.dx).astype(np.int64)
+        rows = np.floor((self.y_max - points[:, 1] * 100) / self.dy).astype(np.int64)
+        in_map = (rows >= 0) & (rows < self.grid_rows) & (cols >= 0) & (cols < self.grid_cols)
+        self.observed_cells[rows[in_map], cols[in_map]] = True
 
-        # Print agent top view map
-        if Configuration.PRINT_TOP_VIEW_IMAGES:
-            plt.savefig("{}/topview_hd.png".format("/".join((file_name.split("/")[:-1]))))
 
-        # Remove agent arrow and white margins
-        plt.subplots_adjust(top=1, bottom=0, right=1, left=0, hspace=0, wspace=0)
-        plt.margins(0, 0)
-        # self.axes.artists = []
-        agent_arrow.remove()
-        plt.axis('off')
-        self.fig.canvas.draw()
-        self.set_grid()
+    def print_top_view(self, pos, angle, file_name):
 
+        # Matplotlib is required only for debugging images
+        import matplotlib.pyplot as plt
 
-    def set_grid(self):
+        fig, axes = plt.subplots(figsize=(int(self.y_axis_len/100),  # 1 is 100 pixel, 1 pixel is 1 centimeter
+                                          int(self.x_axis_len/100)))
+
+        # Draw occupancy grid, obstacle cells are black
+        axes.imshow(self.grid, cmap='gray', vmin=0, vmax=1, interpolation='nearest',
+                    extent=(self.x_min/100, self.x_max/100, self.y_min/100, self.y_max/100))
+
+        # Draw agent arrow
+        agent_width = 0.2  # 20 centimeters
+        axes.arrow(pos['x'], pos['y'],
+                   agent_width * np.cos(np.deg2rad(angle + 90)), agent_width * np.sin(np.deg2rad(angle + 90)),
+                   head_width=agent_width, head_length=agent_width,
+                   length_includes_head=True, fc="Red", ec="Red", alpha=0.9)
 
-        # Rescale agent top view
-        self.grid = Image.frombytes('RGB', self.fig.canvas.get_width_height(), self.fig.canvas.tostring_rgb()).convert('L')
-        self.grid.thumbnail((round(self.y_axis_len/self.dy), round(self.x_axis_len/self.dx)), Image.ANTIALIAS)
-        self.grid = np.array(self.grid)
+        axes.set_aspect('equal')
+        axes.axis('off')
+        fig.subplots_adjust(top=1, bottom=0, right=1, left=0, hspace=0, wspace=0)
+        fig.savefig("{}/topview_hd.png".format("/".join((file_name.split("/")[:-1]))))
+        plt.close(fig)
 
-        # Binarize rescaled agent top view
-        self.grid[(self.grid < 245)] = 0  # 245 is an heuristic threshold
-        self.grid[(self.grid >= 245)] = 1
 
+    def set_grid(self):
 
+        # Binarize occupancy counts, free cells are 1 and obstacle cells are 0
+        self.grid = (self.occupancy_counts < Configuration.MAP_OCCUPANCY_THRSH).astype(np.uint8)
@@ -4,10 +4,46 @@
 # LICENSE file in the root directory of this source tree.
 
 
+import hashlib
+
+import numpy as np
+
+import Configuration
+
 
 class State:
 
-    def __init__(self, state_id, perceptions, visible_objects):
+    __slots__ = ('id', 'perceptions', 'depth', 'depth_digest', 'visible_objects')
+
+    def __init__(self, state_id, perceptions, depth_img, visible_objects):
         self.id = state_id
-        self.perceptions = perceptions
+
+        # Agent position, camera height, held object position, agent angle and camera angle
+        self.perceptions = np.asarray(perceptions, dtype=np.float32)
+
+        # Agent depth view, compressed (see compress_depth()), and a digest of the original one, which identifies
+        # an already visited state
+        self.depth = compress_depth(depth_img)
+        self.depth_digest = get_depth_digest(depth_img)
+
         self.visible_objects = visible_objects
+
+
+def get_depth_digest(depth_img):
+    """
+    Compute a digest of a depth view, i.e., of its original float32 values rather than the compressed ones.
+    :param depth_img: depth view in meters
+    :return: SHA-1 digest of the depth view
+    """
+    return hashlib.sha1(np.ascontiguousarray(depth_img, dtype=np.float32).tobytes()).digest()
+
+
+def compress_depth(depth_img):
+    """
+    Compress a depth view according to the state depth data type set in the configuration.
+    :param depth_img: depth view in meters
+    :return: depth view in millimeters (uint16) or in meters (float16)
+    """
+    if Configuration.STATE_DEPTH_DTYPE == Configuration.STATE_DEPTH_FLOAT16:
+        return np.asarray(depth_img, dtype=np.float16)
+    return np.clip(np.round(np.asarray(depth_img) * 1000), 0, np.iinfo(np.uint16).max).astype(np.uint16)
@@ -8,6 +8,8 @@ import copy
 from collections import defaultdict
 
 import Configuration
+from OGAMUS.Learn.ObjectSpatialIndex import ObjectSpatialIndex
+from OGAMUS.Learn.PredicateStore import PredicateStore
 from Utils import PddlParser
 import numpy as np
 
@@ -17,11 +19,24 @@ class KnowledgeManager:
 
     def __init__(self):
         self.all_objects = defaultdict(list)
-        self.all_predicates = []
+        self.all_predicates = PredicateStore()
 
         self.objects_counting = defaultdict(int)
         self.objects_avg_score = defaultdict(float)
 
+        # Number of object instances created for each object type, which numbers new object ids. Ids of removed
+        # objects are never reused, hence the ids of existing objects never change.
+        self.objects_created = defaultdict(int)
+
+        # Spatial index of object instances positions, which are merged with new object observations
+        self.objects_index = ObjectSpatialIndex(cell_size=0.2)
+
+        # Inspection states of each object, i.e., states where the object is visible and close to the agent, and their
+        # occupancy grid cells. Abstract model states are indexed only once, after they have been added to the model.
+        self.inspection_states = defaultdict(set)
+        self.inspection_cells = defaultdict(set)
+        self.indexed_states = 0
+
     def update_objects(self, new_objects, agent_pos):
         position_threshold = 0.2  # if some x y z coordinate is above threshold, then the object instance is a new one
 
@@ -39,42 +54,41 @@ class KnowledgeManager:
                 new_obj_exists = False
                 merged_object = None
 
-                # Check if an object instance does not exist yet in the current objects dictionary
-                for existing_obj in self.all_objects[obj_type]:
-                    exist_obj_x, exist_obj_y, exist_obj_z = existing_obj['map_x'], existing_obj['map_y'], existing_obj['map_z']
+                # Check if an object instance does not exist yet in the current objects dictionary, i.e., get the
+                # first existing instance within the position threshold
+                close_objs = self.objects_index.query(obj_type, new_obj_x, new_obj_y, new_obj_z, position_threshold)
 
-                    if np.linalg.norm(np.array([exist_obj_x, exist_obj_y, exist_obj_z])
-                                      - np.array([new_obj_x, new_obj_y, new_obj_z])) < position_threshold:
+                if len(close_objs) > 0:
+                    existing_obj = close_objs[0]
 
-                        # Update existing object average score
-                        self.objects_avg_score[existing_obj['id']] = new_obj_type_inst['score']/(self.objects_counting[existing_obj['id']] + 1) \
-                                                + (self.objects_counting[existing_obj['id']]*self.objects_avg_score[existing_obj['id']])/(self.objects_counting[existing_obj['id']] + 1)
+                    # Update existing object average score
+                    self.objects_avg_score[existing_obj['id']] = new_obj_type_inst['score']/(self.objects_counting[existing_obj['id']] + 1) \
+                                            + (self.objects_counting[existing_obj['id']]*self.objects_avg_score[existing_obj['id']])/(self.objects_counting[existing_obj['id']] + 1)
 
-                        # Update objects counting
-                        self.objects_counting[existing_obj['id']] += 1
-
-                        merged_object = copy.deepcopy(new_obj_type_inst)
-                        merged_object['id'] = existing_obj['id']
+                    # Update objects counting
+                    self.objects_counting[existing_obj['id']] += 1
 
-                        # Update existing object bounding box
-                        existing_obj['bb'] = merged_object['bb']
+                    merged_object = copy.deepcopy(new_obj_type_inst)
+                    merged_object['id'] = existing_obj['id']
 
-                        # Update existing object position
-                        existing_obj['map_x'] = merged_object['map_x']/(self.objects_counting[existing_obj['id']] + 1) \
-                                                + (self.objects_counting[existing_obj['id']]*existing_obj['map_x'])/(self.objects_counting[existing_obj['id']] + 1)
-                        existing_obj['map_y'] = merged_object['map_y']/(self.objects_counting[existing_obj['id']] + 1) \
-                                                + (self.objects_counting[existing_obj['id']]*existing_obj['map_y'])/(self.objects_counting[existing_obj['id']] + 1)
-                        existing_obj['map_z'] = merged_object['map_z']/(self.objects_counting[existing_obj['id']] + 1) \
-                                                + (self.objects_counting[existing_obj['id']]*existing_obj['map_z'])/(self.objects_counting[existing_obj['id']] + 1)
+                    # Update existing object bounding box
+                    existing_obj['bb'] = merged_object['bb']
 
-                        new_obj_exists = True
+                    # Update existing object position
+                    existing_obj['map_x'] = merged_object['map_x']/(self.objects_counting[existing_obj['id']] + 1) \
+                                            + (self.objects_counting[existing_obj['id']]*existing_obj['map_x'])/(self.objects_counting[existing_obj['id']] + 1)
+                    existing_obj['map_y'] = merged_object['map_y']/(self.objects_counting[existing_obj['id']] + 1) \
+                                            + (self.objects_counting[existing_obj['id']]*existing_obj['map_y'])/(self.objects_counting[existing_obj['id']] + 1)
+                    existing_obj['map_z'] = merged_object['map_z']/(self.objects_counting[existing_obj['id']] + 1) \
+                                            + (self.objects_counting[existing_obj['id']]*existing_obj['map_z'])/(self.objects_counting[existing_obj['id']] + 1)
+                    self.objects_index.update(obj_type, existing_obj)
 
-                        break
+                    new_obj_exists = True
 
                 # If new object instance does not exist yet in the current objects dictionary
                 if not new_obj_exists:
                     # Update new object id
-                    new_obj_id = "{}_{}".format(obj_type, len(self.all_objects[obj_type]))
+                    new_obj_id = self.get_new_obj_id(obj_type)
 
                     # object instance is a new one
                     new_obj_type_inst['id'] = new_obj_id
@@ -84,6 +98,7 @@ class KnowledgeManager:
                     self.objects_avg_score[new_obj_id] = new_obj_type_inst['score']
 
                     self.all_objects[obj_type].append(new_obj_type_inst)
+                    self.objects_index.add(obj_type, new_obj_type_inst)
                     merged_object = copy.deepcopy(new_obj_type_inst)
 
                 # Add a new object to merged ones
@@ -110,7 +125,10 @@ class KnowledgeManager:
 
                 # Update objects id mapping
                 for obj in new_objects[obj_type]:
-                    objects_id_mapping[obj['id']] = {'id': obj['id'], 'name': obj['name']}
+                    new_obj_id = self.get_new_obj_id(obj_type)
+                    objects_id_mapping[obj['id']] = {'id': new_obj_id, 'name': obj['name']}
+                    obj['id'] = new_obj_id
+                    self.objects_index.add(obj_type, obj)
 
             # There are already some object instances of object type
             else:
@@ -120,88 +138,132 @@ class KnowledgeManager:
 
                     new_obj_exists = False
 
-                    # Check if an object instance does not exist yet in the current objects dictionary
-                    for existing_obj in self.all_objects[obj_type]:
-                        exist_obj_x, exist_obj_y, exist_obj_z = existing_obj['map_x'], existing_obj['map_y'], existing_obj['map_z']
+                    # Check if an object instance does not exist yet in the current objects dictionary, i.e., get the
+                    # first existing instance whose x y z coordinates are all within the position threshold
+                    close_objs = self.objects_index.query(obj_type, new_obj_x, new_obj_y, new_obj_z,
+                                                          position_threshold, box=True)
 
-                        if (new_obj_x - exist_obj_x) < position_threshold \
-                            and (new_obj_y - exist_obj_y) < position_threshold \
-                            and (new_obj_z - exist_obj_z) < position_threshold:
-                            # Change (not) new object instance id to already existing one
-                            objects_id_mapping[new_obj_type_inst['id']] = {'id': existing_obj['id'],
-                                                                           'name':existing_obj['name']}
-                            new_obj_exists = True
-                            break
+                    if len(close_objs) > 0:
+                        existing_obj = close_objs[0]
+                        # Change (not) new object instance id to already existing one
+                        objects_id_mapping[new_obj_type_inst['id']] = {'id': existing_obj['id'],
+                                                                       'name':existing_obj['name']}
+                        new_obj_exists = True
 
                     # If new object instance does not exist yet in the current objects dictionary
                     if not new_obj_exists:
                         # Update new object id
-                        new_obj_id = "{}_{}".format(obj_type, len(self.all_objects[obj_type]))
+                        new_obj_id = self.get_new_obj_id(obj_type)
                         objects_id_mapping[new_obj_type_inst['id']] = {'id':new_obj_id, 'name':new_obj_type_inst['name']}
                         # object instance is a new one
                         new_obj_type_inst['id'] = new_obj_id
                         self.all_objects[obj_type].append(new_obj_type_inst)
+                        self.objects_index.add(obj_type, new_obj_type_inst)
 
         # Return visible objects with updated id
         return objects_id_mapping
 
 
+    def get_new_obj_id(self, obj_type):
+        new_obj_id = "{}_{}".format(obj_type, self.objects_created[obj_type])
+        self.objects_created[obj_type] += 1
+        return new_obj_id
+
+
+    def remove_object(self, obj_id):
+        obj_type = obj_id.split('_')[0]
+        [self.objects_index.remove(obj_type, obj) for obj in self.all_objects[obj_type] if obj['id'] == obj_id]
+        self.all_objects[obj_type] = [obj for obj in self.all_objects[obj_type] if obj['id'] != obj_id]
+
+        # Remove all predicates involving the removed object
+        self.all_predicates.remove_object(obj_id)
+
+        self.objects_counting.pop(obj_id, None)
+        self.objects_avg_score.pop(obj_id, None)
+        self.inspection_states.pop(obj_id, None)
+        self.inspection_cells.pop(obj_id, None)
+
+
     def add_predicate(self, new_predicate):
-        self.all_predicates.append(new_predicate)
+        self.all_predicates.add_string(new_predicate)
 
 
     def remove_predicate(self, removed_predicate):
-        self.all_predicates.remove(removed_predicate)
+        self.all_predicates.discard_string(removed_predicate)
 
 
     def update_all_predicates(self, new_predicates, visible_objects, fsm_model, occupancy_grid):
 
-        self.all_predicates = list(set(self.all_predicates + new_predicates))
+        new_predicates = [PredicateStore.parse(pred) for pred in new_predicates]
+        [self.all_predicates.add(name, *obj_ids) for name, obj_ids in new_predicates]
 
         # Check "hand_free" predicate
-        hand_free = len([o for o in self.all_predicates if o.strip().startswith("holding")]) == 0
-        if hand_free and "hand_free()" not in self.all_predicates:
-            self.all_predicates.append("hand_free()")
+        if len(self.all_predicates.get("holding")) == 0:
+            self.all_predicates.add("hand_free")
 
         # Update "viewing(object)" predicate for all visible objects
-        self.all_predicates = [pred for pred in self.all_predicates if not pred.startswith("viewing")]
-        [self.all_predicates.append("viewing({})".format(obj['id']))
+        self.all_predicates.remove_name("viewing")
+        [self.all_predicates.add("viewing", obj['id'])
         for obj_type in list(visible_objects.keys())
         for obj in visible_objects[obj_type]]
 
-        removed_close_to = []
-        for pred in [p for p in self.all_predicates if p not in new_predicates]:
-            if pred.startswith('close_to'):
-                obj_id = pred.split('(')[1].lower().strip()[:-1]
+        new_close_to = set([obj_ids for name, obj_ids in new_predicates if name == "close_to"])
+        for obj_ids in self.all_predicates.get("close_to"):
+            if obj_ids not in new_close_to:
+                obj_id = obj_ids[0]
                 obj_type = obj_id.split('_')[0]
 
                 obj = [obj for obj in self.all_objects[obj_type] if obj['id'] == obj_id][0]
 
                 if obj['distance'] > Configuration.CLOSE_TO_OBJ_DISTANCE:
-                    removed_close_to.append(pred)
-
-        self.all_predicates = [pred for pred in self.all_predicates if pred not in removed_close_to]
+                    self.all_predicates.discard("close_to", obj_id)
 
-        [self.all_predicates.append("close_to({})".format(obj['id']))
+        [self.all_predicates.add("close_to", obj['id'])
          for obj_type in list(self.all_objects.keys())
          for obj in self.all_objects[obj_type]
          if obj['distance'] <= Configuration.CLOSE_TO_OBJ_DISTANCE]
 
         # Update "inspected(object)" predicate for all objects
-        self.all_predicates = [pred for pred in self.all_predicates if not pred.startswith("inspected")]
-        [self.all_predicates.append("inspected({})".format(obj['id']))
+        self.update_inspection_states(fsm_model, occupancy_grid)
+        self.all_predicates.remove_name("inspected")
+        [self.all_predicates.add("inspected", obj['id'])
          for obj_type in list(self.all_objects.keys())
          for obj in self.all_objects[obj_type]
-         if len([s for s in fsm_model.states
-                 if obj_type in s.visible_objects.keys()
-                 and obj['id'] in [obj['id'] for obj in s.visible_objects[obj_type]
-                                   if obj['distance'] <= Configuration.CLOSE_TO_OBJ_DISTANCE
-                                   and occupancy_grid[occupancy_grid.shape[0] - int(round((s.perceptions[1] * 100 - Configuration.MAP_Y_MIN) / Configuration.MAP_GRID_DY))]
-                                   [int(round((s.perceptions[0] * 100 - Configuration.MAP_X_MIN) / Configuration.MAP_GRID_DX))] != 0]]) > 0]
-        [self.all_predicates.append("inspected({})".format(obj['id']))
+         if self.is_inspected(obj['id'], occupancy_grid)]
+        [self.all_predicates.add("inspected", obj['id'])
          for obj_type in list(self.all_objects.keys())
          for obj in self.all_objects[obj_type]
-         if "close_to({})".format(obj['id']) in self.all_predicates and "viewing({})".format(obj['id']) in self.all_predicates]
+         if self.all_predicates.contains("close_to", obj['id']) and self.all_predicates.contains("viewing", obj['id'])]
+
+
+    def update_inspection_states(self, fsm_model, occupancy_grid):
+
+        for s in fsm_model.states[self.indexed_states:]:
+            state_cell = (occupancy_grid.shape[0] - int(round((s.perceptions[1] * 100 - Configuration.MAP_Y_MIN) / Configuration.MAP_GRID_DY)),
+                          int(round((s.perceptions[0] * 100 - Configuration.MAP_X_MIN) / Configuration.MAP_GRID_DX)))
+
+            for obj_type, obj_instances in s.visible_objects.items():
+                for obj in obj_instances:
+                    if obj['distance'] <= Configuration.CLOSE_TO_OBJ_DISTANCE:
+                        self.inspection_states[obj['id']].add(s.id)
+                        self.inspection_cells[obj['id']].add(state_cell)
+
+        self.indexed_states = len(fsm_model.states)
+
+
+    def is_inspected(self, obj_id, occupancy_grid):
+        """
+        Check if an object has been inspected, i.e., if it has been visible and close to the agent in some state whose
+        grid cell is not an obstacle one. Cells are checked at each step since they become obstacles after collisions.
+        :param obj_id: object id
+        :param occupancy_grid: occupancy map, where 0 is an obstacle cell
+        :return: True if the object has been inspected
+        """
+        if len(self.inspection_cells.get(obj_id, ())) == 0:
+            return False
+
+        rows, cols = zip(*self.inspection_cells[obj_id])
+        return bool(np.any(occupancy_grid[list(rows), list(cols)] != 0))
 
 
     def update_pddl_state(self):
@@ -218,6 +280,7 @@ class KnowledgeManager:
         obj['map_x'] = pos['x']
         obj['map_y'] = pos['y']
         # obj['map_z'] = pos['z']
+        self.objects_index.update(obj_type, obj)
 
 
     def update_all_obj_position(self, micro_action_name, micro_action_result, macro_action_name):
@@ -238,14 +301,13 @@ class KnowledgeManager:
         # Update held object coordinates
         if micro_action_name.startswith("Move") or micro_action_name.startswith("Rotate") \
                 or micro_action_name.startswith("Home") or micro_action_name.startswith("Look"):
-            held_obj_id = [pred.split("(")[1][:-1].strip() for pred in self.all_predicates if pred.startswith("holding(")]
+            held_obj_id = [obj_ids[0] for obj_ids in self.all_predicates.get("holding")]
             if len(held_obj_id) > 0:
                 held_obj_id = held_obj_id[0]
                 self.update_obj_position(held_obj_id, hand_pos)
 
                 # Update coordinates of all objects contained into held one
-                contained_objs = [pred.split("(")[1][:-1].strip().split(",")[0] for pred in self.all_predicates
-                                  if pred.startswith("on(") and pred.split("(")[1][:-1].strip().split(",")[1] == held_obj_id]
+                contained_objs = [obj_ids[0] for obj_ids in self.all_predicates.get("on", held_obj_id, position=1)]
                 for contained_obj_id in contained_objs:
                     self.update_obj_position(contained_obj_id, hand_pos)
 
@@ -256,8 +318,7 @@ class KnowledgeManager:
             self.update_obj_position(obj_id, hand_pos)
 
             # Update coordinates of all objects contained into picked one
-            contained_objs = [pred.split("(")[1][:-1].strip().split(",")[0] for pred in self.all_predicates
-                              if pred.startswith("on(") and pred.split("(")[1][:-1].strip().split(",")[1] == obj_id]
+            contained_objs = [obj_ids[0] for obj_ids in self.all_predicates.get("on", obj_id, position=1)]
             for contained_obj_id in contained_objs:
                 self.update_obj_position(contained_obj_id, hand_pos)
 
@@ -273,8 +334,7 @@ class KnowledgeManager:
             self.update_obj_position(contained_obj_id, container_pos)
 
             # Update coordinates of all objects contained into picked one
-            contained_objs = [pred.split("(")[1][:-1].strip().split(",")[0] for pred in self.all_predicates
-                              if pred.startswith("on(") and pred.split("(")[1][:-1].strip().split(",")[1] == contained_obj_id]
+            contained_objs = [obj_ids[0] for obj_ids in self.all_predicates.get("on", contained_obj_id, position=1)]
             for contained_obj_id in contained_objs:
                 self.update_obj_position(contained_obj_id, container_pos)
 
@@ -4,10 +4,10 @@
 # LICENSE file in the root directory of this source tree.
 
 
-import copy
 from collections import defaultdict
 
 import Configuration
+from OGAMUS.Learn.DetectionCache import DetectionCache
 from OGAMUS.Learn.EnvironmentModels.AbstractModel import AbstractModel
 from OGAMUS.Learn.KnowledgeManager import KnowledgeManager
 from OGAMUS.Learn.Mapper import Mapper
@@ -16,7 +16,7 @@ from OGAMUS.Learn.ObjectDetector_robothor_ogn import ObjectDetector_robothor_ogn
 from OGAMUS.Learn.SceneClassifier import SceneClassifier
 import numpy as np
 
-from Utils.depth_util import get_xyz_point_from_depth
+from Utils.depth_util import get_xyz_points_from_depth_rois
 
 
 class Learner:
@@ -34,8 +34,13 @@ class Learner:
         if Configuration.TASK == Configuration.TASK_OGN_ROBOTHOR:
             self.object_detector = ObjectDetector_robothor_ogn()
 
+        # Object detector predictions of frames observed from visited poses
+        self.detection_cache = None
+        if Configuration.DETECTION_CACHE:
+            self.detection_cache = DetectionCache()
+
         # Scene classifier
-        self.scene_classifier = SceneClassifier()
+        self.scene_classifier = SceneClassifier(self.object_detector.model)
 
         # Knowledge manager
         self.knowledge_manager = KnowledgeManager()
@@ -56,7 +61,14 @@ class Learner:
     def get_visible_objects(self, rgb_img, depth_img, agent_pos, agent_angle, event):
 
         if not Configuration.GROUND_TRUTH_OBJS:
-            pred_objects = self.object_detector.get_visible_objects(rgb_img)
+            pred_objects = None
+            if self.detection_cache is not None:
+                cam_angle = event.metadata['agent']['cameraHorizon']
+                pred_objects = self.detection_cache.get(agent_pos, agent_angle, cam_angle, rgb_img)
+            if pred_objects is None:
+                pred_objects = self.object_detector.get_visible_objects(rgb_img)
+                if self.detection_cache is not None:
+                    self.detection_cache.add(agent_pos, agent_angle, cam_angle, rgb_img, pred_objects)
         else:
             pred_objects = self.object_detector.get_visible_objects_ground_truth(event)
 
@@ -64,35 +76,31 @@ class Learner:
 
         visible_objects = defaultdict(list)
 
-        for obj_type, obj_bb, obj_score in zip(pred_objects['labels'], pred_objects['boxes'], pred_objects['scores']):
+        # Get the depth region of each object, i.e., its bbox reduced by half around the bbox centroid
+        objs_centroid = []
+        objs_roi = []
+        for obj_bb in pred_objects['boxes']:
             # Get object centroid from bbox = [x0, y0, x1, y1]. Notice that y0 and y1 are from top to bottom
             obj_centroid = [int(round((obj_bb[2] + obj_bb[0]) / 2)),  # columns (x-axis)
                             int(round((obj_bb[3] + obj_bb[1]) / 2))]  # rows (y-axis)
+            objs_centroid.append(obj_centroid)
 
-            # Get object distance by averaging object reduced bbox depth values
             obj_bb_size = [obj_bb[2] - obj_bb[0], obj_bb[3] - obj_bb[1]]  # [height, width]
-
-            # Filter non object bbox values
-            depth_matrix = copy.deepcopy(depth_img)
-
-            # Remove first rows
             min_row = max(0, int(round(obj_centroid[1]) - (obj_bb_size[1] * 0.25)) - 1)
-            depth_matrix[:min_row, :] = np.nan
-            # Remove first cols
             min_col = max(0, int(round(obj_centroid[0]) - (obj_bb_size[0] * 0.25)) - 1)
-            depth_matrix[:, :min_col] = np.nan
-            # Remove last rows
             max_row = max(0, int(round(obj_centroid[1]) + (obj_bb_size[1] * 0.25)) + 1)
-            depth_matrix[max_row:, :] = np.nan
-            # Remove last cols
             max_col = max(0, int(round(obj_centroid[0]) + (obj_bb_size[0] * 0.25)) + 1)
-            depth_matrix[:, max_col:] = np.nan
+            objs_roi.append((min_row, max_row, min_col, max_col))
 
-            cam_angle = int(event.metadata['agent']['cameraHorizon'])
-            x_obj, y_obj, z_obj = get_xyz_point_from_depth(depth_matrix, agent_angle, -cam_angle, agent_pos)
+        # Get objects positions by averaging the back-projected depth points of their regions
+        cam_angle = int(event.metadata['agent']['cameraHorizon'])
+        objs_xyz = get_xyz_points_from_depth_rois(depth_img, objs_roi, agent_angle, -cam_angle, agent_pos)
+        objs_distance = np.linalg.norm(np.array([agent_pos['x'], agent_pos['y'], Configuration.CAMERA_HEIGHT])
+                                       - objs_xyz, axis=1)
 
-            obj_distance = np.linalg.norm(np.array([agent_pos['x'], agent_pos['y'], Configuration.CAMERA_HEIGHT])
-                                          - np.array([x_obj, y_obj, z_obj]))
+        for obj_type, obj_bb, obj_score, obj_centroid, (x_obj, y_obj, z_obj), obj_distance \
+                in zip(pred_objects['labels'], pred_objects['boxes'], pred_objects['scores'], objs_centroid,
+                       objs_xyz, objs_distance):
 
             visible_objects[obj_type].append({'id': '{}_{}'.format(obj_type, len(visible_objects[obj_type])),
                                               'map_x': x_obj,
@@ -109,64 +117,11 @@ class Learner:
 
     def remove_object(self, removed_obj_id, evaluator):
 
-        # Remove object from all objects list
-        removed_obj_type = removed_obj_id.split('_')[0]
-        self.knowledge_manager.all_objects[removed_obj_type] = [obj for obj in self.knowledge_manager.all_objects[removed_obj_type]
-                                                                if not obj['id'] == removed_obj_id]
-
-        # Remove all predicates involving the removed object
-        self.knowledge_manager.all_predicates = [el for el in self.knowledge_manager.all_predicates
-                                                 if removed_obj_id not in el.split('(')[1][:-1].strip().split(',')]
-
-        # Rename remaining objects in increasing order
-        renamed_objects = dict()
-        for i in range(len(self.knowledge_manager.all_objects[removed_obj_type])):
-            renamed_objects[self.knowledge_manager.all_objects[removed_obj_type][i]['id']] = '{}_{}'.format(removed_obj_type, i)
-            self.knowledge_manager.all_objects[removed_obj_type][i]['id'] = '{}_{}'.format(removed_obj_type, i)
-
-        # Update predicates with renamed objects
-        for i in range(len(self.knowledge_manager.all_predicates)):
-            for old_obj_name, new_obj_name in renamed_objects.items():
-                self.knowledge_manager.all_predicates[i] = self.knowledge_manager.all_predicates[i].replace(old_obj_name + ',', new_obj_name + ',')
-                self.knowledge_manager.all_predicates[i] = self.knowledge_manager.all_predicates[i].replace(old_obj_name + ')', new_obj_name + ')')
-
-        # Update objects counting with renamed objects
-        old_objs_counting = copy.deepcopy(self.knowledge_manager.objects_counting)
-        self.knowledge_manager.objects_counting = defaultdict(int)
-        old_objs_counting = {k: v for k, v in old_objs_counting.items() if k != removed_obj_id}
-        for k, v in old_objs_counting.items():
-            if k not in renamed_objects.keys():
-                self.knowledge_manager.objects_counting[k] = v
-            else:
-                self.knowledge_manager.objects_counting[renamed_objects[k]] = old_objs_counting[k]
-
-        # Update objects scores with renamed objects
-        old_objs_scores = copy.deepcopy(self.knowledge_manager.objects_avg_score)
-        self.knowledge_manager.objects_avg_score = defaultdict(float)
-        old_objs_scores = {k: v for k, v in old_objs_scores.items() if k != removed_obj_id}
-        for k, v in old_objs_scores.items():
-            if k not in renamed_objects.keys():
-                self.knowledge_manager.objects_avg_score[k] = v
-            else:
-                self.knowledge_manager.objects_avg_score[renamed_objects[k]] = old_objs_scores[k]
-
-        # Remove the objects from all abstract model states and update remaining objects with new names
-        for state in self.abstract_model.states:
-            if removed_obj_type in state.visible_objects.keys():
-                state.visible_objects[removed_obj_type] = [obj for obj in state.visible_objects[removed_obj_type]
-                                                           if obj['id'] != removed_obj_id]
-
-                if len(state.visible_objects[removed_obj_type]) > 0:
-                    for old_obj_name, new_obj_name in renamed_objects.items():
-                        if old_obj_name in [obj['id'] for obj in state.visible_objects[removed_obj_type]]:
-                            old_obj_renamed = copy.deepcopy([obj for obj in state.visible_objects[removed_obj_type]
-                                       if obj['id'] == old_obj_name][0])
-                            old_obj_renamed['id'] = new_obj_name
-                            state.visible_objects[removed_obj_type] = [obj for obj in state.visible_objects[removed_obj_type]
-                                                                   if obj['id'] != old_obj_name]
-                            state.visible_objects[removed_obj_type].append(old_obj_renamed)
+        # Remove object from the knowledge base, object ids are never reused hence remaining objects keep their ids
+        self.knowledge_manager.remove_object(removed_obj_id)
+
+        # Remove the object from the abstract model states where it is visible
+        self.abstract_model.remove_object(removed_obj_id)
 
         # Update objects id mapping (to ground truth ones) for evaluation purposes
-        evaluator.objs_id_mapping = {k: v for k, v in evaluator.objs_id_mapping.items() if k != removed_obj_id}
-        evaluator.objs_id_mapping = {(k if k not in renamed_objects else renamed_objects[k]): v
-                                     for k, v in evaluator.objs_id_mapping.items()}
+        evaluator.objs_id_mapping.pop(removed_obj_id, None)
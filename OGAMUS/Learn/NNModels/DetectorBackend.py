@@ -0,0 +1,196 @@
+# Copyright (c) 2022, Leonardo Lamanna
+# All rights reserved.
+# This source code is licensed under the MIT-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+
+import os
+
+import torch
+
+import numpy as np
+
+import Configuration
+from Utils import Logger, ModelRegistry
+
+
+def get_backend_path(checkpoint_path, backend, quantized):
+    """
+    Get the path of an exported object detector, which is stored next to the fine-tuned checkpoint.
+    :param checkpoint_path: path of the fine-tuned object detector checkpoint
+    :param backend: object detector backend, i.e., Configuration.OBJ_DETECTOR_BACKEND_TORCHSCRIPT or
+    Configuration.OBJ_DETECTOR_BACKEND_ONNX
+    :param quantized: True if the linear layers of the exported model are quantized to int8
+    :return: exported model path
+    """
+    extension = '.pt' if backend == Configuration.OBJ_DETECTOR_BACKEND_TORCHSCRIPT else '.onnx'
+    return "{}{}{}".format(os.path.splitext(checkpoint_path)[0], '_int8' if quantized else '', extension)
+
+
+class SharedFeatures:
+    """
+    Backbone features of the last image given to an object detector, which are shared with the open predicate
+    classifier.
+    """
+
+    def __init__(self):
+        self.features = None
+        self.img = None
+        self.img_size = None
+
+
+    def set(self, rgb_img, features, img_size):
+        self.features = {k: v.detach() for k, v in features.items()}
+        self.img = np.array(rgb_img)
+        self.img_size = img_size
+
+
+    def contains(self, rgb_img):
+        return self.img is not None and np.array_equal(self.img, rgb_img)
+
+
+def get_model(model_name, checkpoint_path, backend, device, build_model):
+    """
+    Get an object detector for the given backend, models are loaded once per process and shared by all episodes.
+    :param model_name: object detector class name
+    :param checkpoint_path: path of the fine-tuned object detector checkpoint
+    :param backend: object detector backend
+    :param device: device of the eager and TorchScript models
+    :param build_model: function building the eager model
+    :return: eager model, TorchScript model or ONNX Runtime session
+    """
+    if backend == Configuration.OBJ_DETECTOR_BACKEND_EAGER:
+        return ModelRegistry.get_model(model_name, checkpoint_path, device, build_model)
+
+    path = get_backend_path(checkpoint_path, backend, Configuration.OBJ_DETECTOR_QUANTIZED)
+    if backend == Configuration.OBJ_DETECTOR_BACKEND_TORCHSCRIPT:
+        return ModelRegistry.get_model(model_name, path, device, lambda: load_torchscript(path, device))
+    return ModelRegistry.get_model(model_name, path, 'onnxruntime', lambda: load_onnx(path))
+
+
+def detect(model, backend, img_tensor, shared_features=None, rgb_img=None):
+    """
+    Detect objects in a batch of images.
+    :param model: object detector returned by get_model()
+    :param backend: object detector backend
+    :param img_tensor: batch of images transformed by the object detector input transform
+    :param shared_features: if not None, the backbone features of the (single) image are kept into it
+    :param rgb_img: RGB image whose features are kept
+    :return: list of detections dictionaries
+    """
+    if shared_features is None:
+        if backend == Configuration.OBJ_DETECTOR_BACKEND_TORCHSCRIPT:
+            return run_torchscript(model, img_tensor)
+        if backend == Configuration.OBJ_DETECTOR_BACKEND_ONNX:
+            return run_onnx(model, img_tensor)
+        return model(img_tensor)
+
+    # Detect objects as done by the torchvision model in evaluation mode, but keep the backbone features
+    original_img_sizes = [(img.shape[-2], img.shape[-1]) for img in img_tensor]
+    images, _ = model.transform(img_tensor)
+    features = model.backbone(images.tensors)
+    proposals, _ = model.rpn(images, features)
+    detections, _ = model.roi_heads(features, proposals, images.image_sizes)
+    detections = model.transform.postprocess(detections, images.image_sizes, original_img_sizes)
+
+    shared_features.set(rgb_img, features, images.image_sizes[0])
+
+    return detections
+
+
+def get_features(model, img_tensor):
+    """
+    Compute the backbone features of a single image.
+    :param model: eager or TorchScript object detector
+    :param img_tensor: single image batch
+    :return: backbone features and image size after the model input transformation
+    """
+    with torch.no_grad():
+        images, _ = model.transform(img_tensor)
+        features = model.backbone(images.tensors)
+    return features, images.image_sizes[0]
+
+
+def load_torchscript(path, device):
+
+    if not os.path.exists(path):
+        Logger.write("ERROR: Cannot find TorchScript object detector in path {}, "
+                     "run export_object_detector.py first".format(path))
+        exit()
+
+    model = torch.jit.load(path, map_location=device)
+    model.eval()
+    return model
+
+
+def load_onnx(path):
+
+    # ONNX Runtime is an optional dependency, which is required by the ONNX backend only
+    import onnxruntime
+
+    if not os.path.exists(path):
+        Logger.write("ERROR: Cannot find ONNX object detector in path {}, "
+                     "run export_object_detector.py first".format(path))
+        exit()
+
+    return onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+
+
+def run_torchscript(model, img_tensor):
+
+    # Scripted detection models take a list of images and always return both the losses and the detections
+    with torch.no_grad():
+        _, detections = model(list(img_tensor))
+    return detections
+
+
+def run_onnx(session, img_tensor):
+
+    # The ONNX model is exported for a single image, whose detections are returned as a (boxes, labels, scores) tuple
+    input_name = session.get_inputs()[0].name
+    detections = []
+    for img in img_tensor:
+        boxes, labels, scores = session.run(None, {input_name: img.cpu().numpy()})
+        detections.append({'boxes': torch.from_numpy(boxes),
+                           'labels': torch.from_numpy(labels),
+                           'scores': torch.from_numpy(scores)})
+    return detections
+
+
+def export_torchscript(model, path, quantized=False, channels_last=False):
+    """
+    Export an eager torchvision object detector to TorchScript.
+    :param model: eager torchvision object detector
+    :param path: exported model path
+    :param quantized: quantize the linear layers (i.e., the box head) to int8, the exported model runs on CPU only
+    :param channels_last: store the convolutional weights in channels last memory format
+    """
+    model = model.cpu().eval()
+
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+
+    if quantized:
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    torch.jit.save(torch.jit.script(model), path)
+
+
+def export_onnx(model, path, quantized=False):
+    """
+    Export an eager torchvision object detector to ONNX, for a single input image of 224x224 pixels.
+    :param model: eager torchvision object detector
+    :param path: exported model path
+    :param quantized: quantize the linear layers (i.e., the box head) to int8
+    """
+    model = model.cpu().eval()
+
+    dummy_img = torch.rand(3, 224, 224)
+    float_path = path if not quantized else "{}_fp32.onnx".format(os.path.splitext(path)[0])
+    torch.onnx.export(model, ([dummy_img],), float_path, opset_version=11, do_constant_folding=True,
+                      input_names=['images'], output_names=['boxes', 'labels', 'scores'])
+
+    if quantized:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(float_path, path, op_types_to_quantize=['MatMul', 'Gemm'], weight_type=QuantType.QInt8)
+        os.remove(float_path)
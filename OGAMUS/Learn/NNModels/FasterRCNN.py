@@ -6,17 +6,19 @@
 
 import copy
 import os
-import pickle
 
 import torch
 import torchvision
 from PIL import Image
+from torchvision.models.detection.backbone_utils import resnet_fpn_backbone
 from torchvision.models.detection.faster_rcnn import FastRCNNPredictor
 from torchvision import transforms
 
 import Configuration
 from Utils import Logger
 from Utils.torchvision_utils import draw_bounding_boxes
+from OGAMUS.Learn.NNModels import DetectorBackend
+from Utils import ModelRegistry
 
 import numpy as np
 import matplotlib
@@ -30,36 +32,58 @@ class FasterRCNN:
         # Use the GPU or the CPU, if a GPU is not available
         self.device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
 
-        # Set the number of classes, 118 categories plus background class (with label 0)
-        num_classes = 119
+        # Inference backend, the eager model is always used when sharing the backbone features
+        self.backend = Configuration.OBJ_DETECTOR_BACKEND
+        if self.backend == Configuration.OBJ_DETECTOR_BACKEND_ONNX and Configuration.SHARED_BACKBONE:
+            Logger.write("ERROR: Object detector backbone features cannot be shared with the ONNX backend")
+            exit()
+
+        # Models with quantized layers run on CPU only
+        if self.backend != Configuration.OBJ_DETECTOR_BACKEND_EAGER and Configuration.OBJ_DETECTOR_QUANTIZED:
+            self.device = torch.device('cpu')
+
+        # Models are loaded once per process and shared by all episodes
+        self.model = DetectorBackend.get_model(type(self).__name__, Configuration.OBJ_DETECTOR_PATH, self.backend,
+                                               self.device, self.build_model)
+
+        # Backbone features of the last image, which are shared with the open predicate classifier
+        self.shared_features = DetectorBackend.SharedFeatures() if Configuration.SHARED_BACKBONE else None
+
+        self.pil_to_tensor = transforms.Compose([
+            transforms.Resize((224, 224)),  # (224, 224) is the size of all images in the custom training set
+            transforms.ToTensor()
+        ])
 
-        # Load an instance segmentation model pre-trained on COCO
-        self.model = torchvision.models.detection.fasterrcnn_resnet50_fpn(pretrained=True)
+        self.categories = ['Background'] + ModelRegistry.get_pickle("Utils/pretrained_models/obj_classes_coco.pkl")
 
-        # Get number of input features for the classifier
-        in_features = self.model.roi_heads.box_predictor.cls_score.in_features
 
-        # Replace the pre-trained head with a new one
-        self.model.roi_heads.box_predictor = FastRCNNPredictor(in_features, num_classes)
+    def build_model(self):
+
+        # Set the number of classes, 118 categories plus background class (with label 0)
+        num_classes = 119
 
         # Load pretrained model on custom dataset, if exists
         if os.path.exists(Configuration.OBJ_DETECTOR_PATH):
-            if not torch.cuda.is_available():
-                self.model.load_state_dict(torch.load(Configuration.OBJ_DETECTOR_PATH,
-                                                      map_location=torch.device('cpu')))
-            else:
-                self.model.load_state_dict(torch.load(Configuration.OBJ_DETECTOR_PATH))
 
-        # move model to the right device
-        self.model.to(self.device)
+            # Build the model architecture without downloading the COCO weights, which would be overwritten
+            model = torchvision.models.detection.FasterRCNN(resnet_fpn_backbone(backbone_name='resnet50', weights=None),
+                                                            num_classes)
+            model.load_state_dict(ModelRegistry.load_checkpoint(Configuration.OBJ_DETECTOR_PATH, self.device))
 
+        else:
+            # Load an instance segmentation model pre-trained on COCO
+            model = torchvision.models.detection.fasterrcnn_resnet50_fpn(pretrained=True)
 
-        self.pil_to_tensor = transforms.Compose([
-            transforms.Resize((224, 224)),  # (224, 224) is the size of all images in the custom training set
-            transforms.ToTensor()
-        ])
+            # Get number of input features for the classifier
+            in_features = model.roi_heads.box_predictor.cls_score.in_features
+
+            # Replace the pre-trained head with a new one
+            model.roi_heads.box_predictor = FastRCNNPredictor(in_features, num_classes)
 
-        self.categories = ['Background'] + pickle.load(open("Utils/pretrained_models/obj_classes_coco.pkl", "rb"))
+        # move model to the right device
+        model.to(self.device)
+
+        return model
 
 
     def resize_boxes(self, boxes, original_size, new_size):
@@ -78,10 +102,30 @@ class FasterRCNN:
         return torch.stack((xmin, ymin, xmax, ymax), dim=1)
 
 
+    def get_features(self, rgb_img):
+        """
+        Get the backbone features of an image, the features computed when detecting objects are reused if the image is
+        the last one given to the object detector.
+        :param rgb_img: RGB image
+        :return: backbone features and image size after the model input transformation
+        """
+        if not self.shared_features.contains(rgb_img):
+
+            # Set model in evaluation mode
+            self.model.eval()
+
+            rgb_img_resized = Image.fromarray(rgb_img, mode="RGB").resize((224, 224))
+            img_tensor = self.pil_to_tensor(rgb_img_resized).unsqueeze(0).to(self.device)
+            self.shared_features.set(rgb_img, *DetectorBackend.get_features(self.model, img_tensor))
+
+        return self.shared_features.features, self.shared_features.img_size
+
+
     def predict(self, rgb_img):
 
         # Set model in evaluation mode
-        self.model.eval()
+        if self.backend != Configuration.OBJ_DETECTOR_BACKEND_ONNX:
+            self.model.eval()
 
         # Predict objects in the image
         rgb_img = Image.fromarray(rgb_img, mode="RGB")
@@ -90,7 +134,8 @@ class FasterRCNN:
         else:
             rgb_img_resized = copy.deepcopy(rgb_img)
 
-        pred = self.model(self.pil_to_tensor(rgb_img_resized).unsqueeze(0).to(self.device))[0]
+        img_tensor = self.pil_to_tensor(rgb_img_resized).unsqueeze(0).to(self.device)
+        pred = DetectorBackend.detect(self.model, self.backend, img_tensor, self.shared_features, rgb_img)[0]
 
         # Resize boxes to fit input image size
         rgb_img_tensor = torch.from_numpy(np.array(rgb_img).transpose((2,0,1))) # move channels to first tensor axis
@@ -98,7 +143,7 @@ class FasterRCNN:
         pred['boxes'] = bbox
 
         # Discard predictions with low scores
-        idx = [i for i, score in enumerate(pred['scores']) if score > Configuration.OBJ_SCORE_THRSH]
+        idx = pred['scores'] > Configuration.OBJ_SCORE_THRSH
         pred['boxes'] = pred['boxes'][idx]
         pred['labels'] = pred['labels'][idx]
         pred['scores'] = pred['scores'][idx]
@@ -6,7 +6,6 @@
 
 import copy
 import os
-import pickle
 import torch
 import torchvision
 from PIL import Image
@@ -14,12 +13,14 @@ import numpy as np
 import matplotlib
 import Configuration
 
-from torchvision.models.detection.faster_rcnn import FastRCNNPredictor
+from torchvision.models.detection.backbone_utils import resnet_fpn_backbone
 from torchvision import transforms
 from matplotlib.cm import cmaps_listed
 color_palette = matplotlib.cm.get_cmap('viridis', 119).colors
 from Utils.torchvision_utils import draw_bounding_boxes
 from Utils import Logger
+from OGAMUS.Learn.NNModels import DetectorBackend
+from Utils import ModelRegistry
 
 
 class FasterRCNN_robothor_ogn:
@@ -29,39 +30,52 @@ class FasterRCNN_robothor_ogn:
         # Use the GPU or the CPU, if a GPU is not available
         self.device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
 
-        # Set the number of classes, 13 categories plus background class (with label 0)
-        num_classes = 14
+        # Inference backend, the eager model is always used when sharing the backbone features
+        self.backend = Configuration.OBJ_DETECTOR_BACKEND
+        if self.backend == Configuration.OBJ_DETECTOR_BACKEND_ONNX and Configuration.SHARED_BACKBONE:
+            Logger.write("ERROR: Object detector backbone features cannot be shared with the ONNX backend")
+            exit()
+
+        # Models with quantized layers run on CPU only
+        if self.backend != Configuration.OBJ_DETECTOR_BACKEND_EAGER and Configuration.OBJ_DETECTOR_QUANTIZED:
+            self.device = torch.device('cpu')
 
-        # Load an instance segmentation model pre-trained on COCO
-        self.model = torchvision.models.detection.fasterrcnn_resnet50_fpn(pretrained=True)
+        # Models are loaded once per process and shared by all episodes
+        self.model = DetectorBackend.get_model(type(self).__name__, Configuration.OBJ_DETECTOR_ROBOTHOR_OGN_PATH,
+                                               self.backend, self.device, self.build_model)
 
-        # Get number of input features for the classifier
-        in_features = self.model.roi_heads.box_predictor.cls_score.in_features
+        # Backbone features of the last image, which are shared with the open predicate classifier
+        self.shared_features = DetectorBackend.SharedFeatures() if Configuration.SHARED_BACKBONE else None
 
-        # Replace the pre-trained head with a new one
-        self.model.roi_heads.box_predictor = FastRCNNPredictor(in_features, num_classes)
+        self.pil_to_tensor = transforms.Compose([
+            transforms.Resize((224, 224)),  # (224, 224) is the size of all images in the custom training set
+            transforms.ToTensor()
+        ])
+
+        self.categories = ['Background'] + ModelRegistry.get_pickle("Utils/pretrained_models/obj_classes_robothor_ogn.pkl")
+
+
+    def build_model(self):
+
+        # Set the number of classes, 13 categories plus background class (with label 0)
+        num_classes = 14
 
         # Load pretrained model on custom dataset, if exists
-        path = 'Utils/pretrained_models/faster-rcnn_12classes.pth'
+        path = Configuration.OBJ_DETECTOR_ROBOTHOR_OGN_PATH
         if os.path.exists(path):
-            if not torch.cuda.is_available():
-                self.model.load_state_dict(torch.load(path, map_location=torch.device('cpu')))
-            else:
-                self.model.load_state_dict(torch.load(path))
+
+            # Build the model architecture without downloading the COCO weights, which would be overwritten
+            model = torchvision.models.detection.FasterRCNN(resnet_fpn_backbone(backbone_name='resnet50', weights=None),
+                                                            num_classes)
+            model.load_state_dict(ModelRegistry.load_checkpoint(path, self.device))
         else:
             Logger.write("ERROR: Cannot find object detector model in path {}".format(path))
             exit()
 
         # move model to the right device
-        self.model.to(self.device)
+        model.to(self.device)
 
-
-        self.pil_to_tensor = transforms.Compose([
-            transforms.Resize((224, 224)),  # (224, 224) is the size of all images in the custom training set
-            transforms.ToTensor()
-        ])
-
-        self.categories = ['Background'] + pickle.load(open("Utils/pretrained_models/obj_classes_robothor_ogn.pkl", "rb"))
+        return model
 
 
     def resize_boxes(self, boxes, original_size, new_size):
@@ -80,10 +94,30 @@ class FasterRCNN_robothor_ogn:
         return torch.stack((xmin, ymin, xmax, ymax), dim=1)
 
 
+    def get_features(self, rgb_img):
+        """
+        Get the backbone features of an image, the features computed when detecting objects are reused if the image is
+        the last one given to the object detector.
+        :param rgb_img: RGB image
+        :return: backbone features and image size after the model input transformation
+        """
+        if not self.shared_features.contains(rgb_img):
+
+            # Set model in evaluation mode
+            self.model.eval()
+
+            rgb_img_resized = Image.fromarray(rgb_img, mode="RGB").resize((224, 224))
+            img_tensor = self.pil_to_tensor(rgb_img_resized).unsqueeze(0).to(self.device)
+            self.shared_features.set(rgb_img, *DetectorBackend.get_features(self.model, img_tensor))
+
+        return self.shared_features.features, self.shared_features.img_size
+
+
     def predict(self, rgb_img):
 
         # Set model in evaluation mode
-        self.model.eval()
+        if self.backend != Configuration.OBJ_DETECTOR_BACKEND_ONNX:
+            self.model.eval()
 
         # Predict objects in the image
         rgb_img = Image.fromarray(rgb_img, mode="RGB")
@@ -91,7 +125,8 @@ class FasterRCNN_robothor_ogn:
             rgb_img_resized = rgb_img.resize((224, 224))
         else:
             rgb_img_resized = copy.deepcopy(rgb_img)
-        pred = self.model(self.pil_to_tensor(rgb_img_resized).unsqueeze(0).to(self.device))[0]
+        img_tensor = self.pil_to_tensor(rgb_img_resized).unsqueeze(0).to(self.device)
+        pred = DetectorBackend.detect(self.model, self.backend, img_tensor, self.shared_features, rgb_img)[0]
 
         # Resize boxes to fit input image size
         rgb_img_tensor = torch.from_numpy(np.array(rgb_img).transpose((2, 0, 1)))  # move channels to first tensor axis
@@ -99,7 +134,7 @@ class FasterRCNN_robothor_ogn:
         pred['boxes'] = bbox
 
         # Discard predictions with low scores
-        idx = [i for i, score in enumerate(pred['scores']) if score > Configuration.OBJ_SCORE_THRSH]
+        idx = pred['scores'] > Configuration.OBJ_SCORE_THRSH
         pred['boxes'] = pred['boxes'][idx]
         pred['labels'] = pred['labels'][idx]
         pred['scores'] = pred['scores'][idx]
@@ -11,11 +11,11 @@ import torch
 
 class OpenPredicateClassifierNN(nn.Module):
 
-    def __init__(self):
+    def __init__(self, pretrained_backbone=True):
         super(OpenPredicateClassifierNN, self).__init__()
 
-        # Get pretrained resnet backbone for visual features extraction
-        pretrained_backbone = True
+        # Get pretrained resnet backbone for visual features extraction, ImageNet weights are not needed when loading
+        # the weights of a trained classifier
         trainable_backbone_layers = 5  # From PyTorch fasterrcnn_resnet50_fpn example
         self.backbone = resnet_fpn_backbone('resnet50', pretrained_backbone, trainable_layers=trainable_backbone_layers)
 
@@ -0,0 +1,34 @@
+# Copyright (c) 2022, Leonardo Lamanna
+# All rights reserved.
+# This source code is licensed under the MIT-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+
+from torch import nn
+from torchvision.ops import MultiScaleRoIAlign
+import torch
+
+
+class OpenPredicateClassifierROINN(nn.Module):
+
+    def __init__(self):
+        super(OpenPredicateClassifierROINN, self).__init__()
+
+        # Pool object detector FPN features within object bboxes, i.e., 256 channels of 4x4 features as the 'pool'
+        # features of OpenPredicateClassifierNN
+        self.roi_pool = MultiScaleRoIAlign(featmap_names=['0', '1', '2', '3'], output_size=4, sampling_ratio=2)
+
+        # First fully connected layer
+        self.fc1 = nn.Linear(4096, 1)
+
+
+    def forward(self, features, boxes, image_sizes):
+
+        # Get object features vectors
+        features = self.roi_pool(features, boxes, image_sizes)
+        features = torch.flatten(features, start_dim=1)
+
+        # Apply linear layer
+        x = self.fc1(features)
+
+        return x
@@ -0,0 +1,93 @@
+# Copyright (c) 2022, Leonardo Lamanna
+# All rights reserved.
+# This source code is licensed under the MIT-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+
+import math
+from collections import defaultdict
+
+
+class ObjectSpatialIndex:
+    """
+    Spatial hash of the object instances positions, for each object type. The map is partitioned into cubic cells, and
+    each object instance is stored into the cell of its position. Objects within a radius from a position are searched
+    in the cells around the position one only.
+    """
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+
+        # Object instances of each cell, i.e., (object type, cell) -> {instance key: (insertion order, instance)}
+        self.cells = defaultdict(dict)
+
+        # Object type and cell of each instance, instances are identified by their dictionary identity
+        self.instances_cell = dict()
+
+        self.insertions = 0
+
+
+    def get_cell(self, x, y, z):
+        # Objects with unknown position (i.e., without valid depth points) are never close to other ones
+        if math.isnan(x) or math.isnan(y) or math.isnan(z):
+            return None
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size), math.floor(z / self.cell_size))
+
+
+    def add(self, obj_type, obj):
+        cell = self.get_cell(obj['map_x'], obj['map_y'], obj['map_z'])
+        self.instances_cell[id(obj)] = (obj_type, cell)
+        self.cells[(obj_type, cell)][id(obj)] = (self.insertions, obj)
+        self.insertions += 1
+
+
+    def remove(self, obj_type, obj):
+        obj_type, cell = self.instances_cell.pop(id(obj))
+        del self.cells[(obj_type, cell)][id(obj)]
+        if len(self.cells[(obj_type, cell)]) == 0:
+            del self.cells[(obj_type, cell)]
+
+
+    def update(self, obj_type, obj):
+        """
+        Move an object instance into the cell of its updated position.
+        """
+        old_obj_type, old_cell = self.instances_cell[id(obj)]
+        cell = self.get_cell(obj['map_x'], obj['map_y'], obj['map_z'])
+        if cell != old_cell:
+            self.cells[(obj_type, cell)][id(obj)] = self.cells[(obj_type, old_cell)].pop(id(obj))
+            if len(self.cells[(obj_type, old_cell)]) == 0:
+                del self.cells[(obj_type, old_cell)]
+            self.instances_cell[id(obj)] = (obj_type, cell)
+
+
+    def query(self, obj_type, x, y, z, radius, box=False):
+        """
+        Get the object instances of a type which are close to a position.
+        :param obj_type: object type
+        :param x: position x coordinate
+        :param y: position y coordinate
+        :param z: position z coordinate
+        :param radius: maximum (excluded) distance from the position
+        :param box: if True, the distance along each axis is compared with the radius, rather than the euclidean one
+        :return: list of close object instances, sorted by insertion order
+        """
+        cell = self.get_cell(x, y, z)
+        if cell is None:
+            return []
+
+        n_cells = int(math.ceil(radius / self.cell_size))
+        close_objs = []
+        for i in range(cell[0] - n_cells, cell[0] + n_cells + 1):
+            for j in range(cell[1] - n_cells, cell[1] + n_cells + 1):
+                for k in range(cell[2] - n_cells, cell[2] + n_cells + 1):
+                    for insertion, obj in self.cells.get((obj_type, (i, j, k)), {}).values():
+                        dx, dy, dz = obj['map_x'] - x, obj['map_y'] - y, obj['map_z'] - z
+                        if box:
+                            close = abs(dx) < radius and abs(dy) < radius and abs(dz) < radius
+                        else:
+                            close = math.sqrt(dx * dx + dy * dy + dz * dz) < radius
+                        if close:
+                            close_objs.append((insertion, obj))
+
+        return [obj for insertion, obj in sorted(close_objs, key=lambda el: el[0])]
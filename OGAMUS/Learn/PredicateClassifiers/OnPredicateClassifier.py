@@ -9,14 +9,30 @@ import os
 import torch
 from torchvision import transforms
 from OGAMUS.Learn.NNModels.OnPredicateClassifierNN import OnPredicateClassifierNN
+from Utils import ModelRegistry
 
 
 class OnPredicateClassifier:
 
     def __init__(self, input_model_path=None):
 
-        # Initialize neural network model
-        self.model = OnPredicateClassifierNN()
+        # Initialize neural network model, models are loaded once per process and shared by all episodes
+        device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
+        self.model = ModelRegistry.get_model(OnPredicateClassifierNN.__name__, input_model_path, device,
+                                             lambda: self.load_model(input_model_path))
+
+        # Set input data transformation
+        self.transform = transforms.Compose([
+            transforms.Resize((224, 224)),
+            transforms.ToTensor(),
+            transforms.Normalize(
+                mean=[0.485, 0.456, 0.406],  # These are RGB mean+std values
+                std=[0.229, 0.224, 0.225])   # across a large photo dataset.
+        ])
+
+    def load_model(self, input_model_path):
+
+        model = OnPredicateClassifierNN()
 
         # Load input model weights
         if input_model_path is not None:
@@ -24,41 +40,37 @@ class OnPredicateClassifier:
             # Load pretrained model on custom dataset, if exists
             if os.path.exists(input_model_path):
 
-                if not torch.cuda.is_available():
-                    self.model.load_state_dict(torch.load(input_model_path, map_location=torch.device('cpu')))
-                else:
-                    self.model.load_state_dict(torch.load(input_model_path))
+                device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
+                model.load_state_dict(ModelRegistry.load_checkpoint(input_model_path, device))
             else:
                 raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), input_model_path)
 
-        # Set input data transformation
-        self.transform = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(
-                mean=[0.485, 0.456, 0.406],  # These are RGB mean+std values
-                std=[0.229, 0.224, 0.225])   # across a large photo dataset.
-        ])
+        return model
 
     def predict(self, objs_feats):
 
+        # Create single sample batch
+        y_pred_tag, y_pred_score = self.predict_batch([objs_feats])
+
+        return y_pred_tag[0], y_pred_score[0]
+
+    def predict_batch(self, objs_feats):
+
         # Set model in evaluation mode
         self.model.eval()
 
-        # Transform features list into tensor
-        objs_feats = torch.FloatTensor(objs_feats)
+        # Transform features matrix into tensor, i.e., a batch with a sample for each row
+        objs_feats = torch.as_tensor(objs_feats, dtype=torch.float32)
 
-        # Create single sample batch
-        objs_feats = objs_feats.unsqueeze(0)
-
-        # Predict
-        y_pred = self.model(objs_feats)
+        # Predict all samples with a single matrix product
+        with torch.no_grad():
+            y_pred = self.model(objs_feats)
         y_score = torch.sigmoid(y_pred)
         y_pred_tag = torch.round(y_score)
-        y_pred_score = y_score.flatten().cpu().detach().numpy().astype(float)
-        y_pred_tag = y_pred_tag.flatten().cpu().detach().numpy().astype(int)
+        y_pred_score = y_score.flatten().cpu().numpy().astype(float)
+        y_pred_tag = y_pred_tag.flatten().cpu().numpy().astype(int)
 
-        return y_pred_tag[0], y_pred_score[0]
+        return y_pred_tag, y_pred_score
 
 
 
@@ -12,14 +12,32 @@ from torchvision import transforms
 
 import Configuration
 from OGAMUS.Learn.NNModels.OpenPredicateClassifierNN import OpenPredicateClassifierNN
+from OGAMUS.Learn.NNModels.OpenPredicateClassifierROINN import OpenPredicateClassifierROINN
+from Utils import ModelRegistry
 
 
 class OpenPredicateClassifier:
 
-    def __init__(self, input_model_path=None):
+    def __init__(self, input_model_path=None, shared_backbone=False):
 
-        # Initialize neural network model
-        self.model = OpenPredicateClassifierNN()
+        # Initialize neural network model, with a shared backbone the model classifies object detector features.
+        # Models are loaded once per process and shared by all episodes.
+        model_class = OpenPredicateClassifierROINN if shared_backbone else OpenPredicateClassifierNN
+        device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
+        self.model = ModelRegistry.get_model(model_class.__name__, input_model_path, device,
+                                             lambda: self.load_model(model_class, input_model_path))
+
+        # Set input data transformation
+        self.transform = transforms.Compose([
+            transforms.Resize((224, 224)),
+            transforms.ToTensor(),
+            transforms.Normalize(
+                mean=[0.485, 0.456, 0.406],  # These are RGB mean+std values
+                std=[0.229, 0.224, 0.225])   # across a large photo dataset.
+        ])
+
+
+    def load_model(self, model_class, input_model_path):
 
         # Load input model weights
         if input_model_path is not None:
@@ -27,43 +45,66 @@ class OpenPredicateClassifier:
             # Load pretrained model on custom dataset, if exists
             if os.path.exists(input_model_path):
 
-                if not torch.cuda.is_available():
-                    self.model.load_state_dict(torch.load(input_model_path, map_location=torch.device('cpu')))
+                # The backbone pretrained weights are not downloaded, since they are overwritten by the input ones
+                if model_class == OpenPredicateClassifierNN:
+                    model = model_class(pretrained_backbone=False)
                 else:
-                    self.model.load_state_dict(torch.load(input_model_path))
+                    model = model_class()
+                device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
+                model.load_state_dict(ModelRegistry.load_checkpoint(input_model_path, device))
 
             else:
                 raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), input_model_path)
 
-        # Set input data transformation
-        self.transform = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(
-                mean=[0.485, 0.456, 0.406],  # These are RGB mean+std values
-                std=[0.229, 0.224, 0.225])   # across a large photo dataset.
-        ])
+        else:
+            model = model_class()
+
+        return model
 
 
     def predict(self, rgb_img):
 
+        # Create single sample batch
+        y_pred_tag, y_pred_score = self.predict_batch([rgb_img])
+
+        return y_pred_tag[0]
+
+
+    def predict_batch(self, rgb_imgs):
+
         # Set model in evaluation mode
         self.model.eval()
 
-        # Normalize input image
-        rgb_img = self.transform(Image.fromarray(rgb_img))
-
-        # Create single sample batch
-        rgb_img = rgb_img.unsqueeze(0)
+        # Normalize input images and stack them into a single batch
+        rgb_imgs = torch.stack([self.transform(Image.fromarray(rgb_img)) for rgb_img in rgb_imgs])
 
         # Predict
-        y_pred = self.model(rgb_img)
+        with torch.no_grad():
+            y_pred = self.model(rgb_imgs)
         # y_pred_tag = torch.round(torch.sigmoid(y_pred))
         y_pred_tag_sigm = torch.sigmoid(y_pred)
         y_pred_tag = torch.where(y_pred_tag_sigm >= Configuration.OPEN_CLASSIFIER_THRSH, 1, 0)
-        y_pred_tag = y_pred_tag.flatten().cpu().detach().numpy().astype(int)
+        y_pred_score = y_pred_tag_sigm.flatten().cpu().numpy().astype(float)
+        y_pred_tag = y_pred_tag.flatten().cpu().numpy().astype(int)
 
-        return y_pred_tag[0]
+        return y_pred_tag, y_pred_score
+
+
+    def predict_features(self, features, boxes, image_size):
+
+        # Set model in evaluation mode
+        self.model.eval()
+        self.model.to(boxes.device)
+
+        # Predict
+        with torch.no_grad():
+            y_pred = self.model(features, [boxes], [image_size])
+        y_pred_tag_sigm = torch.sigmoid(y_pred)
+        y_pred_tag = torch.where(y_pred_tag_sigm >= Configuration.OPEN_CLASSIFIER_THRSH, 1, 0)
+        y_pred_score = y_pred_tag_sigm.flatten().cpu().numpy().astype(float)
+        y_pred_tag = y_pred_tag.flatten().cpu().numpy().astype(int)
+
+        return y_pred_tag, y_pred_score
 
 
 
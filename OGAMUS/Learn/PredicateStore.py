@@ -0,0 +1,142 @@
+# Copyright (c) 2022, Leonardo Lamanna
+# All rights reserved.
+# This source code is licensed under the MIT-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+
+from collections import defaultdict
+
+
+class PredicateStore:
+    """
+    Set of ground predicates, e.g. on(apple_0,plate_1). Each predicate is stored as a (name, arguments) tuple, where
+    arguments are integer handles of the interned object ids. Predicates are indexed by name and by argument, and
+    their string representation is generated on demand only (e.g. for PDDL output).
+    """
+
+    def __init__(self):
+        self.predicates = set()
+
+        # Predicates indexed by name and by argument handle
+        self.name_predicates = defaultdict(set)
+        self.arg_predicates = defaultdict(set)
+
+        # Interned object ids, i.e., object id -> handle and handle -> object id
+        self.obj_handles = dict()
+        self.obj_ids = dict()
+
+
+    def get_handle(self, obj_id):
+        if obj_id not in self.obj_handles:
+            handle = len(self.obj_handles)
+            self.obj_handles[obj_id] = handle
+            self.obj_ids[handle] = obj_id
+        return self.obj_handles[obj_id]
+
+
+    @staticmethod
+    def parse(pred_str):
+        """
+        Parse a predicate string, e.g. "on(apple_0,plate_1)".
+        :param pred_str: predicate string
+        :return: (predicate name, tuple of object ids)
+        """
+        name, args = pred_str.strip().split('(', 1)
+        return name.strip(), tuple([arg.strip() for arg in args.strip()[:-1].split(',') if arg.strip() != ''])
+
+
+    def to_string(self, name, obj_ids):
+        return "{}({})".format(name, ",".join(obj_ids))
+
+
+    def get_key(self, name, obj_ids):
+        # Objects which have never been interned are not involved in any predicate
+        if any([obj_id not in self.obj_handles for obj_id in obj_ids]):
+            return None
+        return name, tuple([self.obj_handles[obj_id] for obj_id in obj_ids])
+
+
+    def add(self, name, *obj_ids):
+        pred = name, tuple([self.get_handle(obj_id) for obj_id in obj_ids])
+        if pred not in self.predicates:
+            self.predicates.add(pred)
+            self.name_predicates[name].add(pred)
+            for handle in pred[1]:
+                self.arg_predicates[handle].add(pred)
+
+
+    def discard(self, name, *obj_ids):
+        pred = self.get_key(name, obj_ids)
+        if pred is not None and pred in self.predicates:
+            self.remove_key(pred)
+
+
+    def remove_key(self, pred):
+        self.predicates.remove(pred)
+        self.name_predicates[pred[0]].discard(pred)
+        for handle in pred[1]:
+            self.arg_predicates[handle].discard(pred)
+
+
+    def contains(self, name, *obj_ids):
+        return self.get_key(name, obj_ids) in self.predicates
+
+
+    def add_string(self, pred_str):
+        name, obj_ids = self.parse(pred_str)
+        self.add(name, *obj_ids)
+
+
+    def discard_string(self, pred_str):
+        name, obj_ids = self.parse(pred_str)
+        self.discard(name, *obj_ids)
+
+
+    def get(self, name, obj_id=None, position=None):
+        """
+        Get the arguments of all predicates with a given name, optionally involving an object.
+        :param name: predicate name
+        :param obj_id: if not None, only predicates involving the object are considered
+        :param position: if not None, the object must be the argument in the given position
+        :return: list of tuples of object ids
+        """
+        if obj_id is None:
+            preds = self.name_predicates.get(name, ())
+        elif obj_id not in self.obj_handles:
+            return []
+        else:
+            handle = self.obj_handles[obj_id]
+            preds = [pred for pred in self.arg_predicates.get(handle, ())
+                     if pred[0] == name and (position is None or pred[1][position] == handle)]
+        return [tuple([self.obj_ids[handle] for handle in pred[1]]) for pred in preds]
+
+
+    def remove_name(self, name):
+        for pred in list(self.name_predicates.get(name, ())):
+            self.remove_key(pred)
+
+
+    def remove_object(self, obj_id):
+        if obj_id in self.obj_handles:
+            for pred in list(self.arg_predicates.get(self.obj_handles[obj_id], ())):
+                self.remove_key(pred)
+
+
+    def items(self):
+        """
+        :return: (predicate name, tuple of object ids) of all predicates
+        """
+        return [(pred[0], tuple([self.obj_ids[handle] for handle in pred[1]])) for pred in self.predicates]
+
+
+    def __contains__(self, pred_str):
+        name, obj_ids = self.parse(pred_str)
+        return self.contains(name, *obj_ids)
+
+
+    def __iter__(self):
+        return iter([self.to_string(name, obj_ids) for name, obj_ids in self.items()])
+
+
+    def __len__(self):
+        return len(self.predicates)
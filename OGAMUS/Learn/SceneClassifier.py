@@ -4,29 +4,39 @@
 # LICENSE file in the root directory of this source tree.
 
 
-import pickle
 from collections import defaultdict
 
 import numpy as np
+import torch
 
 import Configuration
 from OGAMUS.Learn.PredicateClassifiers.OnPredicateClassifier import OnPredicateClassifier
 from OGAMUS.Learn.PredicateClassifiers.OpenPredicateClassifier import OpenPredicateClassifier
-from Utils.util import get1_hot_vector
+from Utils import ModelRegistry
 
 
 class SceneClassifier:
 
 
-    def __init__(self):
+    def __init__(self, object_detector_model=None):
         self.scene_objects = None
 
+        # Object detector model, whose backbone features are shared with the open predicate classifier
+        self.object_detector_model = object_detector_model
+
         # Set open predicate classifier
-        self.open_classifier = OpenPredicateClassifier(input_model_path=Configuration.OPEN_CLASSIFIER_PATH)
+        if Configuration.SHARED_BACKBONE:
+            self.open_classifier = OpenPredicateClassifier(input_model_path=Configuration.OPEN_CLASSIFIER_ROI_PATH,
+                                                           shared_backbone=True)
+        else:
+            self.open_classifier = OpenPredicateClassifier(input_model_path=Configuration.OPEN_CLASSIFIER_PATH)
         self.on_classifier = OnPredicateClassifier(input_model_path=Configuration.ON_CLASSIFIER_PATH)
 
         # Set object classes
-        self.obj_classes = [obj_class.lower() for obj_class in pickle.load(open(Configuration.OBJ_CLASSES_PATH, "rb"))]
+        self.obj_classes = [obj_class.lower() for obj_class in ModelRegistry.get_pickle(Configuration.OBJ_CLASSES_PATH)]
+        self.obj_classes_index = dict()
+        for obj_class_index, obj_class in enumerate(self.obj_classes):
+            self.obj_classes_index.setdefault(obj_class, obj_class_index)
 
 
     def get_visible_predicates(self, visible_objects, rgb_img):
@@ -34,6 +44,60 @@ class SceneClassifier:
         # visible_objects_id = defaultdict(list)
         visible_predicates = defaultdict(dict)
 
+        # Predict whether objects are open by means of a neural network classifier, all openable objects are
+        # classified within a single batch
+        openable_objs = [obj for obj_type in visible_objects for obj in visible_objects[obj_type]
+                         if obj['id'].split("_")[0] in Configuration.OPENABLE_OBJS]
+        objs_open = dict()
+        if len(openable_objs) > 0 and Configuration.SHARED_BACKBONE:
+            # Classify object detector backbone features within objects bboxes
+            features, features_img_size = self.object_detector_model.get_features(rgb_img)
+            boxes_scale = [features_img_size[1] / rgb_img.shape[1], features_img_size[0] / rgb_img.shape[0]] * 2
+            boxes = torch.tensor([obj['bb']['corner_points'] for obj in openable_objs], dtype=torch.float32)
+            boxes = boxes * torch.tensor(boxes_scale, dtype=torch.float32)
+            objs_open_tags, objs_open_scores = self.open_classifier.predict_features(
+                features, boxes.to(features['0'].device), features_img_size)
+            objs_open = {obj['id']: bool(obj_open) for obj, obj_open in zip(openable_objs, objs_open_tags)}
+        elif len(openable_objs) > 0:
+            openable_objs_img_rgb = []
+            for obj in openable_objs:
+                # Crop image to object bbox
+                obj_bbox = [int(coord) for coord in obj['bb']['corner_points']]
+                openable_objs_img_rgb.append(rgb_img[
+                                             max(0, obj_bbox[1] - 3): min(rgb_img.shape[0], obj_bbox[3] + 4),
+                                             max(0, obj_bbox[0] - 3): min(rgb_img.shape[1], obj_bbox[2] + 4),
+                                             :
+                                             ])
+            objs_open_tags, objs_open_scores = self.open_classifier.predict_batch(openable_objs_img_rgb)
+            objs_open = {obj['id']: bool(obj_open) for obj, obj_open in zip(openable_objs, objs_open_tags)}
+
+        # Predict whether an object is contained into another one by means of a neural network classifier, all
+        # (contained, container) object pairs are classified within a single batch
+        all_objs = [obj for obj_type in visible_objects for obj in visible_objects[obj_type]]
+        container_objs = [obj for obj in all_objs if obj['id'].split("_")[0] in Configuration.RECEPTACLE_OBJS]
+        objs_pairs = [(obj, container_obj) for obj in all_objs for container_obj in container_objs
+                      if container_obj['id'] != obj['id']]
+        objs_containers = defaultdict(list)  # e.g. objs_containers[obj_id] = [obj1_id, obj2_id]
+        if len(objs_pairs) > 0:
+            # Pair features are the contained and container one hot class vectors followed by their bboxes
+            classes_num = len(self.obj_classes)
+            pairs_feats = np.zeros((len(objs_pairs), 2*classes_num + 8), dtype=np.float32)
+            pairs_rows = np.arange(len(objs_pairs))
+            pairs_feats[pairs_rows, [self.obj_classes_index[obj['id'].split("_")[0]]
+                                     for obj, container_obj in objs_pairs]] = 1
+            pairs_feats[pairs_rows, [classes_num + self.obj_classes_index[container_obj['id'].split("_")[0]]
+                                     for obj, container_obj in objs_pairs]] = 1
+            pairs_feats[:, 2*classes_num:2*classes_num + 4] = [[round(el, 2) for el in obj['bb']['corner_points']]
+                                                               for obj, container_obj in objs_pairs]
+            pairs_feats[:, 2*classes_num + 4:] = [[round(el, 2) for el in container_obj['bb']['corner_points']]
+                                                  for obj, container_obj in objs_pairs]
+
+            pairs_on, pairs_scores = self.on_classifier.predict_batch(pairs_feats)
+
+            for (obj, container_obj), on in zip(objs_pairs, pairs_on):
+                if on and obj['id'].split("_")[0].lower() not in Configuration.NOT_CONTAINED_OBJS:
+                    objs_containers[obj['id']].append(container_obj['id'])
+
         for obj_type in visible_objects:
             for obj in visible_objects[obj_type]:
                 obj_name = obj['id']
@@ -43,51 +107,15 @@ class SceneClassifier:
                 # The difference among 'inspected' and 'close' is that 'inspected' is persistent
                 obj_inspected = bool(obj['distance'] <= Configuration.CLOSE_TO_OBJ_DISTANCE)
 
-                # Crop image to object bbox
-                obj_bbox = [int(coord) for coord in obj['bb']['corner_points']]
-                obj_img_rgb = rgb_img[
-                              max(0, obj_bbox[1] - 3): min(rgb_img.shape[0], obj_bbox[3] + 4),
-                              max(0, obj_bbox[0] - 3): min(rgb_img.shape[1], obj_bbox[2] + 4),
-                              :
-                              ]
-
                 obj_openable = obj_type in Configuration.OPENABLE_OBJS
                 obj_pickable = obj_type in Configuration.PICKUPABLE_OBJS
                 obj_receptacle = obj_type in Configuration.RECEPTACLE_OBJS
 
-                # Predict whether an object is open by means of a neural network classifier
-                if obj_openable:
-                    obj_open = bool(self.open_classifier.predict(obj_img_rgb))
-                else:
-                    obj_open = False
-
-                containers = []  # e.g. containers = [obj1_id, obj2_id]
-                containers_scores = []
-                # Predict whether an object is contained into another one by means of a neural network classifier
-                for container_obj in [container_obj for obj_type in visible_objects
-                                      for container_obj in visible_objects[obj_type]
-                                      if container_obj['id'].split("_")[0] in Configuration.RECEPTACLE_OBJS
-                                         and container_obj['id'] != obj_name]:
-                    contained_type = obj_type
-                    container_type = container_obj['id'].split("_")[0]
-                    contained_class_index = self.obj_classes.index(contained_type)
-                    container_class_index = self.obj_classes.index(container_type)
-
-                    contained_bbox = [round(el, 2) for el in obj['bb']['corner_points']]
-                    container_bbox = [round(el, 2) for el in container_obj['bb']['corner_points']]
-
-                    example = []
-                    example.extend(list(get1_hot_vector(contained_class_index, len(self.obj_classes))))
-                    example.extend(list(get1_hot_vector(container_class_index, len(self.obj_classes))))
-                    example.extend(contained_bbox)
-                    example.extend(container_bbox)
-
-                    on, score = self.on_classifier.predict(example)
-                    on, score = bool(on), float(score)
-
-                    if on and contained_type.lower() not in Configuration.NOT_CONTAINED_OBJS:
-                        containers.append(container_obj['id'])
-                        containers_scores.append(score)
+                # Check whether an object is open
+                obj_open = objs_open.get(obj_name, False)
+
+                # Get objects containing the object
+                containers = list(objs_containers[obj_name])
 
                 # Update object visible predicates
                 if Configuration.TASK == Configuration.TASK_ON and obj_name.split('_')[0] == Configuration.GOAL_OBJECTS[1]:
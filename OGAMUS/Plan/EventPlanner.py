@@ -118,11 +118,19 @@ class EventPlanner:
             sampling_distance = 1000
 
         explorable = True
+        frontier_explorable = Configuration.FRONTIER_EXPLORATION
         while self.path_plan is None or len(self.path_plan) == 0:
 
+            frontier_goal_position = None
+            if not explorable and frontier_explorable:
+                frontier_goal_position = self.path_planner.get_frontier_goal()
+                frontier_explorable = False
+
             if explorable:
                 self.goal_position = [(Configuration.MAP_X_MIN + (Configuration.MOVE_STEP * 100 * 2)) / 100,
                                       (Configuration.MAP_Y_MIN + (Configuration.MOVE_STEP * 100 * 2)) / 100]
+            elif frontier_goal_position is not None:
+                self.path_planner.goal_position = frontier_goal_position
             else:
                 self.path_planner.goal_position = [random.randint(max(self.path_planner.map_model.x_min + (Configuration.MOVE_STEP*100*2),
                                                                       int(agent_x_pos*100) - sampling_distance),
@@ -8,7 +8,7 @@ import datetime
 import re
 import subprocess
 
-from Utils import Logger
+from Utils import Logger, PddlParser
 
 
 class PDDLPlanner:
@@ -36,6 +36,9 @@ class PDDLPlanner:
         # DEBUG
         start = datetime.datetime.now()
 
+        # Write the PDDL problem file, if it has changed since the last plan
+        PddlParser.write_pddl_problem()
+
         bash_command = "./OGAMUS/Plan/PDDL/Planners/FF/ff -o OGAMUS/Plan/PDDL/domain.pddl -f OGAMUS/Plan/PDDL/facts.pddl"
 
         process = subprocess.Popen(bash_command.split(), stdout=subprocess.PIPE)
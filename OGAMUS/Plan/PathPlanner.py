@@ -6,6 +6,7 @@
 
 import collections
 import copy
+import heapq
 import math
 
 import numpy as np
@@ -27,11 +28,16 @@ class PathPlanner:
         self.agent_position = None
         self.agent_angle = None
 
+        # Cached distance field from the agent cell, together with the grid and starting cell it was computed on
+        self.distance_field = None
+        self.distance_field_grid = None
+        self.distance_field_start = None
+
 
     def path_planning(self):
 
         # Get occupancy grid
-        grid = copy.deepcopy(self.get_occupancy_grid())
+        grid = self.get_occupancy_grid()
 
         # Add agent starting position into occupancy grid
         start = [self.agent_position['x']*100, self.agent_position['y']*100]
@@ -48,18 +54,28 @@ class PathPlanner:
         if grid[grid.shape[0] - goal_grid[1]][goal_grid[0]] == 0:
             return None
 
-        grid[grid.shape[0] - goal_grid[1]][goal_grid[0]] = 2  # 2 is the goal integer identifier in the grid
-
         # DEBUG plot grid
         if Configuration.PRINT_TOP_VIEW_GRID_PLAN_IMAGES:
             grid_debug = copy.deepcopy(grid)
+            grid_debug[grid.shape[0] - goal_grid[1]][goal_grid[0]] = 2  # 2 is the goal integer identifier in the grid
             grid_debug[(grid_debug==1)] = 255
             grid_debug[(grid_debug==2)] = 180
             grid_debug[start_grid[1]][start_grid[0]] = 100
             Logger.save_img("topview_grid_noplan.png", grid_debug)
 
-        # Compute plan into resized occupancy grid
-        grid_plan = self.bfs(grid, start_grid, goal)
+        # Compute plan into resized occupancy grid with the grid search algorithm set in the configuration
+        if Configuration.PATH_SEARCH == Configuration.PATH_SEARCH_ASTAR:
+            # A* expands only the cells towards the goal one
+            goal_cell_grid = np.array(grid, copy=True)
+            goal_cell_grid[grid.shape[0] - goal_grid[1]][goal_grid[0]] = 2  # 2 is the goal identifier
+            grid_plan = self.astar(goal_cell_grid, start_grid)
+        else:
+            # The distance field is shared by all goals checked against the same map and agent position
+            distances, parents, visited = self.get_distance_field(grid, start_grid)
+            grid_plan = None
+            if distances[grid.shape[0] - goal_grid[1]][goal_grid[0]] >= 0:
+                grid_plan = self.get_path(parents, (grid.shape[0] - goal_grid[1]) * grid.shape[1] + goal_grid[0],
+                                          grid.shape[1])
         plan = self.compile_plan(grid_plan)
 
         # Plot grid with plan for debugging
@@ -79,8 +95,6 @@ class PathPlanner:
         # Get occupancy grid
         grid = copy.deepcopy(self.get_occupancy_grid())
 
-        single_goal_grid = copy.deepcopy(grid)
-
         # Add agent starting position into occupancy grid
         agent_pos = [self.agent_position['x'], self.agent_position['y'], self.agent_position['z']]
         start = [self.agent_position['x']*100, self.agent_position['y']*100]
@@ -88,6 +102,9 @@ class PathPlanner:
                       int(round((start[1]-self.map_model.y_min)/self.map_model.dy)))
         start_grid = (start_grid[0], grid.shape[0] - start_grid[1])  # starting column and row of the grid
 
+        # Compute the number of moves from the agent cell to every grid cell
+        distances, parents, visited = self.get_distance_field(grid, start_grid)
+
         # Add goal cell marker into occupancy grid
         goal = [self.goal_position[0]*100, self.goal_position[1]*100]
         goal_grid = [int(round((goal[0]-self.map_model.x_min)/self.map_model.dx)),
@@ -112,14 +129,12 @@ class PathPlanner:
 
                     if np.linalg.norm(np.array(goal_pos) - np.array(cell_pos)) < Configuration.CLOSE_TO_OBJ_DISTANCE:
 
-                        single_goal_grid[grid.shape[0] - (goal_grid[1] + i)][goal_grid[0] + j] = 2
-                        single_goal_path = self.bfs(single_goal_grid, start_grid, goal)
-                        if single_goal_path is not None and len(single_goal_path)*0.25 < np.linalg.norm(np.array(goal_pos) - np.array(agent_pos))*3:
+                        # The path towards the goal cell includes the agent cell
+                        single_goal_distance = distances[grid.shape[0] - (goal_grid[1] + i)][goal_grid[0] + j]
+                        if single_goal_distance >= 0 and (single_goal_distance + 1)*0.25 < np.linalg.norm(np.array(goal_pos) - np.array(agent_pos))*3:
                             grid[grid.shape[0] - (goal_grid[1] + i)][goal_grid[0] + j] = 2   # 2 is the goal integer identifier in the grid
                             feasible_goal = True
 
-                        single_goal_grid[grid.shape[0] - (goal_grid[1] + i)][goal_grid[0] + j] = 1
-
         if not feasible_goal:
             return None
 
@@ -135,8 +150,8 @@ class PathPlanner:
         if grid[start_grid[1]][start_grid[0]] == 2:
             return []
 
-        # Compute plan into resized occupancy grid
-        grid_plan = self.bfs(grid, start_grid, goal)
+        # Compute plan into resized occupancy grid, i.e., the path towards the nearest goal cell
+        grid_plan = self.get_nearest_goal_path(grid, parents, visited)
         plan = self.compile_plan(grid_plan)
 
         # Plot grid with plan for debugging
@@ -151,74 +166,11 @@ class PathPlanner:
         return plan
 
 
-# Add more goal points around the goal point and within the manipulation distance
-    def path_planning_greedy(self):
-
-        # Get occupancy grid
-        grid = copy.deepcopy(self.get_occupancy_grid())
-
-        # Add agent starting position into occupancy grid
-        start = [self.agent_position['x']*100, self.agent_position['y']*100]
-        start_grid = (int(round((start[0]-self.map_model.x_min)/self.map_model.dx)),
-                      int(round((start[1]-self.map_model.y_min)/self.map_model.dy)))
-        start_grid = (start_grid[0], grid.shape[0] - start_grid[1])  # starting column and row of the grid
-
-        # Add goal cell marker into occupancy grid
-        goal = [self.goal_position[0]*100, self.goal_position[1]*100]
-        goal_grid = [int(round((goal[0]-self.map_model.x_min)/self.map_model.dx)),
-                     int(round((goal[1]-self.map_model.y_min)/self.map_model.dy))]
-
-        feasible_goal = False
-        if grid[grid.shape[0] - goal_grid[1]][goal_grid[0]] != 0:
-            feasible_goal = True
-            grid[grid.shape[0] - goal_grid[1]][goal_grid[0]] = 2  # 2 is the goal integer identifier in the grid
-
-        # Add greedy goal cells marker into occupancy grid, i.e. positions within manipulation distance from goal point
-        for i in range(- int(Configuration.MAX_DISTANCE_MANIPULATION / (Configuration.MOVE_STEP*100)),
-                       int(Configuration.MAX_DISTANCE_MANIPULATION / (Configuration.MOVE_STEP*100)) + 1):
-            for j in range(- int(Configuration.MAX_DISTANCE_MANIPULATION / (Configuration.MOVE_STEP*100)),
-                           int(Configuration.MAX_DISTANCE_MANIPULATION / (Configuration.MOVE_STEP*100)) + 1):
-                if grid[grid.shape[0] - (goal_grid[1] + i)][goal_grid[0] + j] != 0:
-                    grid[grid.shape[0] - (goal_grid[1] + i)][goal_grid[0] + j] = 2   # 2 is the goal integer identifier in the grid
-                    feasible_goal = True
-
-        if not feasible_goal:
-            return None
-
-        # DEBUG plot grid
-        if Configuration.PRINT_TOP_VIEW_GRID_PLAN_IMAGES:
-            grid_debug = copy.deepcopy(grid)
-            grid_debug[(grid_debug==1)] = 255
-            grid_debug[(grid_debug==2)] = 180
-            grid_debug[start_grid[1]][start_grid[0]] = 100
-            Logger.save_img("topview_grid_noplan.png", grid_debug)
-
-        # Check if agent position is already a goal one
-        if grid[start_grid[1]][start_grid[0]] == 2:
-            return []
-
-        # Compute plan into resized occupancy grid
-        grid_plan = self.bfs(grid, start_grid, goal)
-        plan = self.compile_plan(grid_plan)
-
-        # Plot grid with plan for debugging
-        if Configuration.PRINT_TOP_VIEW_GRID_PLAN_IMAGES:
-            if grid_plan is not None:
-                idx_i, idx_j = zip(*grid_plan)
-                grid_debug[idx_j, idx_i] = 220  # draw plan
-                grid_debug[(grid_debug == 2)] = 180  # draw goal position
-                grid_debug[start_grid[1]][start_grid[0]] = 100  # draw agent position
-                Logger.save_img("topview_grid.png", grid_debug)
-
-        return plan
-
-
     # Add more goal points around the goal point and within the manipulation distance
     def path_planning_greedy_inspect(self, start_position, goal_position, non_goal_grid_cells=None):
 
         # Get occupancy grid
         grid = copy.deepcopy(self.get_occupancy_grid())
-        single_goal_grid = copy.deepcopy(grid)
 
         # Add agent starting position into occupancy grid
         start = [start_position['x'] * 100, start_position['y'] * 100]
@@ -226,6 +178,9 @@ class PathPlanner:
                       int(round((start[1] - self.map_model.y_min) / self.map_model.dy)))
         start_grid = (start_grid[0], grid.shape[0] - start_grid[1])  # starting column and row of the grid
 
+        # Compute the number of moves from the agent cell to every grid cell
+        distances, parents, visited = self.get_distance_field(grid, start_grid)
+
         # Add goal cell marker into occupancy grid
         goal = [goal_position[0] * 100, goal_position[1] * 100]
         goal_grid = [int(round((goal[0] - self.map_model.x_min) / self.map_model.dx)),
@@ -247,13 +202,9 @@ class PathPlanner:
 
                             if np.linalg.norm(np.array(goal_position) - np.array(cell_pos)) < Configuration.CLOSE_TO_OBJ_DISTANCE:
 
-                                single_goal_grid[grid.shape[0] - (goal_grid[1] + i)][goal_grid[0] + j] = 2
-                                single_goal_path = self.bfs(single_goal_grid, start_grid, goal)
-                                if single_goal_path is not None:
+                                if distances[grid.shape[0] - (goal_grid[1] + i)][goal_grid[0] + j] >= 0:
                                     grid[grid.shape[0] - (goal_grid[1] + i)][goal_grid[0] + j] = 2   # 2 is the goal integer identifier in the grid
 
-                                single_goal_grid[grid.shape[0] - (goal_grid[1] + i)][goal_grid[0] + j] = 1
-
         # DEBUG plot grid
         if Configuration.PRINT_TOP_VIEW_GRID_PLAN_IMAGES:
             grid_debug = copy.deepcopy(grid)
@@ -266,8 +217,8 @@ class PathPlanner:
         if grid[start_grid[1]][start_grid[0]] == 2:
             return []
 
-        # Compute plan into resized occupancy grid
-        grid_plan = self.bfs(grid, start_grid, goal)
+        # Compute plan into resized occupancy grid, i.e., the path towards the nearest goal cell
+        grid_plan = self.get_nearest_goal_path(grid, parents, visited)
         plan = self.compile_plan(grid_plan)
 
         # Plot grid with plan for debugging
@@ -282,6 +233,71 @@ class PathPlanner:
         return plan
 
 
+    def get_frontier_goal(self):
+        """
+        Select an exploration goal among frontiers, i.e., clusters of known free grid cells adjacent to unknown ones.
+        Frontiers are ranked by their number of cells (expected information gain) per move required to reach them.
+        :return: goal position [x, y] in meters, i.e., the nearest reachable cell of the best frontier, or None if no
+        frontier is reachable
+        """
+
+        # Get occupancy grid
+        grid = self.get_occupancy_grid()
+        observed_cells = self.map_model.observed_cells
+
+        # Add agent starting position into occupancy grid
+        start = [self.agent_position['x']*100, self.agent_position['y']*100]
+        start_grid = (int(round((start[0]-self.map_model.x_min)/self.map_model.dx)),
+                      int(round((start[1]-self.map_model.y_min)/self.map_model.dy)))
+        start_grid = (start_grid[0], grid.shape[0] - start_grid[1])  # starting column and row of the grid
+
+        distances, parents, visited = self.get_distance_field(grid, start_grid)
+
+        # Get known free cells with at least one unknown adjacent cell
+        unknown_cells = np.pad(~observed_cells, 1, mode='constant', constant_values=False)
+        unknown_adjacent = unknown_cells[:-2, 1:-1] | unknown_cells[2:, 1:-1] \
+                           | unknown_cells[1:-1, :-2] | unknown_cells[1:-1, 2:]
+        frontier_rows, frontier_cols = np.nonzero((grid != 0) & observed_cells & unknown_adjacent)
+        frontier_cells = set(zip(frontier_rows.tolist(), frontier_cols.tolist()))
+
+        best_goal_cell = None
+        best_utility = 0
+        while frontier_cells:
+
+            # Cluster 8-connected frontier cells
+            frontier = [frontier_cells.pop()]
+            queue = collections.deque(frontier)
+            while queue:
+                row, col = queue.popleft()
+                for adjacent_cell in ((row+1, col), (row-1, col), (row, col+1), (row, col-1),
+                                      (row-1, col-1), (row-1, col+1), (row+1, col+1), (row+1, col-1)):
+                    if adjacent_cell in frontier_cells:
+                        frontier_cells.remove(adjacent_cell)
+                        frontier.append(adjacent_cell)
+                        queue.append(adjacent_cell)
+
+            if len(frontier) < Configuration.FRONTIER_MIN_SIZE:
+                continue
+
+            # The frontier goal cell is the nearest reachable one
+            goal_cells = [(distances[row, col], (row, col)) for row, col in frontier
+                          if distances[row, col] >= Configuration.FRONTIER_MIN_DISTANCE]
+            if len(goal_cells) == 0:
+                continue
+            goal_distance, goal_cell = min(goal_cells)
+
+            utility = len(frontier) / (goal_distance + 1)
+            if best_goal_cell is None or utility > best_utility:
+                best_goal_cell = goal_cell
+                best_utility = utility
+
+        if best_goal_cell is None:
+            return None
+
+        return [(best_goal_cell[1]*self.map_model.dx + self.map_model.x_min) / 100,
+                ((grid.shape[0] - best_goal_cell[0])*self.map_model.dy + self.map_model.y_min) / 100]
+
+
     def get_occupancy_grid(self):
         # Add collision cells into occupancy grid
         for cell in self.map_model.collision_cells:
@@ -289,42 +305,207 @@ class PathPlanner:
         return self.map_model.grid
 
 
-    def bfs(self, grid, start, goal):
+    def get_adjacent_cells(self, x, y):
+        if Configuration.DIAGONAL_MOVE:
+            return (x+1, y), (x-1, y), (x, y+1), (x, y-1), (x-1, y-1), (x-1, y+1), (x+1, y+1), (x+1, y-1)
+        return (x+1, y), (x-1, y), (x, y+1), (x, y-1)
+
+
+    def get_path(self, parents, cell_index, width):
         """
-        Example call
-        wall, clear, goal = "#", ".", "*"
-        width, height = 10, 5
-        grid = ["..........",
-                "..*#...##.",
-                "..##...#*.",
-                ".....###..",
-                "......*..."]
-        path = bfs(grid, (5, 2))
-        :param grid: occupancy map
+        Rebuild the path ending in a grid cell by following the predecessors of each cell.
+        :param parents: flattened array of predecessor cell indices, the starting cell is its own predecessor
+        :param cell_index: flattened index of the last path cell
+        :param width: grid width
+        :return: list of grid cells (column, row)
+        """
+        path = []
+        while True:
+            path.append((cell_index % width, cell_index // width))
+            if parents[cell_index] == cell_index:
+                break
+            cell_index = int(parents[cell_index])
+        path.reverse()
+        return path
+
+
+    def astar(self, grid, start):
+        """
+        A* search towards the nearest goal cell. All moves have unit cost as in bfs_distances(), hence the heuristic is
+        the Manhattan distance when moving along the grid axes and the Chebyshev distance (i.e. the octile one with unit
+        diagonal cost) when diagonal moves are allowed.
+        :param grid: occupancy map, where 0 is an obstacle cell and 2 is a goal cell
         :param start: starting grid cell
-        :return:
+        :return: list of grid cells (column, row) from start to goal, or None if no goal cell is reachable
         """
         wall = 0
         goal = 2
         height = grid.shape[0]
         width = grid.shape[1]
-        queue = collections.deque([[start]])
-        seen = set([tuple(start)])
-        while queue:
-            path = queue.popleft()
-            x, y = path[-1]
-            if grid[y][x] == goal:
-                return path
-            adjacent_cells = ((x+1, y), (x-1, y), (x, y+1), (x, y-1))
+        cells = grid.tolist()
+
+        goal_rows, goal_cols = np.nonzero(grid == goal)
+        if len(goal_rows) == 0:
+            return None
+
+        def heuristic(x, y):
+            dx = np.abs(goal_cols - x)
+            dy = np.abs(goal_rows - y)
             if Configuration.DIAGONAL_MOVE:
-                adjacent_cells = ((x+1, y), (x-1, y), (x, y+1), (x, y-1), (x-1, y-1), (x-1, y+1), (x+1, y+1), (x+1, y-1))
+                return int(np.min(np.maximum(dx, dy)))
+            return int(np.min(dx + dy))
+
+        # Predecessor and cost from start of each visited cell
+        parents = np.full(height * width, -1, dtype=np.int64)
+        costs = np.full(height * width, np.iinfo(np.int64).max, dtype=np.int64)
+        start_index = start[1] * width + start[0]
+        parents[start_index] = start_index
+        costs[start_index] = 0
+
+        # Queue entries are (estimated total cost, heuristic, insertion order, cost from start, column, row). Ties are
+        # broken by preferring cells closer to the goal, then in first in first out order.
+        counter = 0
+        start_h = heuristic(start[0], start[1])
+        queue = [(start_h, start_h, counter, 0, start[0], start[1])]
+        while queue:
+            _, _, _, cost, x, y = heapq.heappop(queue)
+            if cost > costs[y * width + x]:
+                continue
+            if cells[y][x] == goal:
+                return self.get_path(parents, y * width + x, width)
 
-            for x2, y2 in adjacent_cells:
+            for x2, y2 in self.get_adjacent_cells(x, y):
                 if 0 <= x2 < width and 0 <= y2 < height \
-                        and grid[y2][x2] != wall \
-                        and (x2, y2) not in seen:
-                    queue.append(path + [(x2, y2)])
-                    seen.add((x2, y2))
+                        and cells[y2][x2] != wall \
+                        and cost + 1 < costs[y2 * width + x2]:
+                    costs[y2 * width + x2] = cost + 1
+                    parents[y2 * width + x2] = y * width + x
+                    counter += 1
+                    h = heuristic(x2, y2)
+                    heapq.heappush(queue, (cost + 1 + h, h, counter, cost + 1, x2, y2))
+
+
+    def bfs_distances(self, grid, start):
+        """
+        Breadth first search which expands all the grid cells reachable from the starting one, hence it answers
+        reachability and path length queries towards any grid cell with a single search.
+        :param grid: occupancy map
+        :param start: starting grid cell, i.e., (column, row)
+        :return: number of moves from start to each grid cell (-1 for unreachable cells), flattened predecessor array
+        and flattened indices of reached cells in visiting order
+        """
+        wall = 0
+        height = grid.shape[0]
+        width = grid.shape[1]
+        cells = grid.tolist()
+
+        distances = np.full((height, width), -1, dtype=np.int64)
+        distances[start[1], start[0]] = 0
+        parents = np.full(height * width, -1, dtype=np.int64)
+        parents[start[1] * width + start[0]] = start[1] * width + start[0]
+        visited = []
+
+        queue = collections.deque([tuple(start)])
+        while queue:
+            x, y = queue.popleft()
+            visited.append(y * width + x)
+            for x2, y2 in self.get_adjacent_cells(x, y):
+                if 0 <= x2 < width and 0 <= y2 < height \
+                        and cells[y2][x2] != wall \
+                        and parents[y2 * width + x2] == -1:
+                    queue.append((x2, y2))
+                    parents[y2 * width + x2] = y * width + x
+                    distances[y2, x2] = distances[y, x] + 1
+
+        return distances, parents, np.array(visited, dtype=np.int64)
+
+
+    def get_distance_field(self, grid, start):
+        """
+        Get the distance field computed by bfs_distances() from the starting grid cell. The last distance field is
+        cached and reused as long as the occupancy map and the starting cell do not change. When the occupancy map
+        changes, the cached distance field is repaired if possible, otherwise it is computed from scratch.
+        :param grid: occupancy map, where 0 is an obstacle cell
+        :param start: starting grid cell, i.e., (column, row)
+        :return: distances, predecessors and visited cells as returned by bfs_distances()
+        """
+        start = tuple(start)
+
+        if self.distance_field is not None and self.distance_field_start == start \
+                and self.distance_field_grid.shape == grid.shape:
+            if np.array_equal(self.distance_field_grid, grid):
+                return self.distance_field
+            distance_field = self.repair_distance_field(grid, start)
+            if distance_field is not None:
+                self.distance_field = distance_field
+                self.distance_field_grid = np.array(grid, copy=True)
+                return self.distance_field
+
+        self.distance_field = self.bfs_distances(grid, start)
+        self.distance_field_grid = np.array(grid, copy=True)
+        self.distance_field_start = start
+        return self.distance_field
+
+
+    def repair_distance_field(self, grid, start):
+        """
+        Update the cached distance field after some grid cells have changed, e.g. when collision cells are added.
+        Changes which do not affect any shortest path are handled without a new search, i.e., new obstacles on leaf
+        cells of the search tree and changed cells which are not adjacent to any reachable cell.
+        :param grid: new occupancy map
+        :param start: starting grid cell, i.e., (column, row)
+        :return: repaired distance field, or None if the distance field must be computed from scratch
+        """
+        distances, parents, visited = self.distance_field
+        height = grid.shape[0]
+        width = grid.shape[1]
+
+        changed_rows, changed_cols = np.nonzero(np.asarray(grid) != self.distance_field_grid)
+        changed_cells = changed_rows * width + changed_cols
+        if start[1] * width + start[0] in changed_cells:
+            return None
+
+        blocked_cells = []
+        for row, col in zip(changed_rows, changed_cols):
+            if distances[row, col] >= 0:
+                # A reachable cell may only become an obstacle
+                if grid[row, col] != 0:
+                    return None
+                blocked_cells.append(row * width + col)
+            else:
+                # A cell adjacent to a reachable one may become reachable
+                for col2, row2 in self.get_adjacent_cells(col, row):
+                    if 0 <= col2 < width and 0 <= row2 < height and distances[row2, col2] >= 0:
+                        return None
+
+        if len(blocked_cells) == 0:
+            return distances, parents, visited
+
+        # Obstacle cells must be leaves of the search tree, i.e., no reachable cell is reached through them
+        if np.any(np.isin(parents, blocked_cells)):
+            return None
+
+        distances = distances.copy()
+        parents = parents.copy()
+        distances.ravel()[blocked_cells] = -1
+        parents[blocked_cells] = -1
+        visited = visited[~np.isin(visited, blocked_cells)]
+        return distances, parents, visited
+
+
+    def get_nearest_goal_path(self, grid, parents, visited):
+        """
+        Get the path towards the first goal cell visited by bfs_distances(), i.e., a shortest path to the nearest one.
+        :param grid: occupancy map, where 2 is a goal cell
+        :param parents: flattened predecessor array returned by bfs_distances()
+        :param visited: flattened indices of reached cells returned by bfs_distances()
+        :return: list of grid cells (column, row), or None if no goal cell is reachable
+        """
+        goal = 2
+        reached_goals = visited[grid.ravel()[visited] == goal]
+        if len(reached_goals) == 0:
+            return None
+        return self.get_path(parents, int(reached_goals[0]), grid.shape[1])
 
 
     def compile_plan(self, plan):
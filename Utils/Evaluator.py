@@ -5,13 +5,12 @@
 
 
 import json
-import pickle
 import re
 from collections import defaultdict
 import numpy as np
 import Configuration
 
-from Utils import Logger
+from Utils import Logger, ModelRegistry, PddlParser
 
 from ai2thor.util.metrics import (
     compute_single_spl,
@@ -32,7 +31,7 @@ class Evaluator:
         self.gt_predicates = []
 
         # Set object classes
-        self.obj_classes = [obj_class.lower() for obj_class in pickle.load(open(Configuration.OBJ_CLASSES_PATH, "rb"))]
+        self.obj_classes = [obj_class.lower() for obj_class in ModelRegistry.get_pickle(Configuration.OBJ_CLASSES_PATH)]
 
         # Used for Object Goal Navigation task when computing SPL.
         self.shortest_path = None
@@ -120,15 +119,10 @@ class Evaluator:
         # Map and store belief predicates
         belief_predicates = agent.learner.knowledge_manager.all_predicates
         mapped_belief_predicates = []
-        for pred in belief_predicates:
-            for belief_obj_id in belief_objects:
-                if belief_obj_id in self.objs_id_mapping:
-                    pred = pred.replace(belief_obj_id + ')', self.objs_id_mapping[belief_obj_id] + ')')
-                    pred = pred.replace(belief_obj_id + ',', self.objs_id_mapping[belief_obj_id] + ',')
-                else:
-                    pred = pred.replace(belief_obj_id, "unknown_" + belief_obj_id)
-
-            mapped_belief_predicates.append(pred)
+        for pred_name, obj_ids in belief_predicates.items():
+            mapped_obj_ids = [self.objs_id_mapping[obj_id] if obj_id in self.objs_id_mapping else "unknown_" + obj_id
+                              for obj_id in obj_ids]
+            mapped_belief_predicates.append("{}({})".format(pred_name, ",".join(mapped_obj_ids)))
 
         mapped_belief_predicates_global = [pred for pred in mapped_belief_predicates
                                            if not pred.split("(")[0] in ["pickupable", "receptacle", "openable"]]
@@ -309,6 +303,15 @@ class Evaluator:
 
 
 
+    def get_goal_facts(self):
+        """
+        Get the goal facts of the current pddl problem, sorted by their string, e.g. the goal objects declaration
+        "(?o1 - apple)" comes first.
+        :return: list of goal facts strings
+        """
+        return sorted(re.findall("\([^()]*\)", PddlParser.get_pddl_problem().goal))
+
+
     def eval_goal_achievement_objectnav(self, all_objects, last_event, agent_path, controller):
 
         assert self.shortest_path is not None, "Set shortest_path in Evaluator.py for computing SPL for " \
@@ -317,12 +320,8 @@ class Evaluator:
         # Update ground truth state
         self.update_gt_state(all_objects, last_event)
 
-        # Get current goal from pddl problem file
-        with open(Configuration.PDDL_PROBLEM_PATH, 'r') as f:
-            data = [el.strip() for el in f.read().split("\n") if not el.strip().startswith(";")]
-            goal = re.findall(":goal.*","".join(data))[0]
-
-        goal_facts = sorted(re.findall("\([^()]*\)", goal))
+        # Get current goal facts from pddl problem
+        goal_facts = self.get_goal_facts()
         goal_objects = goal_facts[0]
 
         goal_objects = [el for el in goal_objects.strip()[1:-1].split() if el.strip() != "-"]
@@ -406,12 +405,8 @@ class Evaluator:
         # Update ground truth state
         self.update_gt_state(all_objects, last_event)
 
-        # Get current goal from pddl problem file
-        with open(Configuration.PDDL_PROBLEM_PATH, 'r') as f:
-            data = [el.strip() for el in f.read().split("\n") if not el.strip().startswith(";")]
-            goal = re.findall(":goal.*","".join(data))[0]
-
-        goal_facts = sorted(re.findall("\([^()]*\)", goal))
+        # Get current goal facts from pddl problem
+        goal_facts = self.get_goal_facts()
         goal_objects = goal_facts[0]
         goal_facts = goal_facts[1:]
 
@@ -490,12 +485,8 @@ class Evaluator:
         # Update ground truth state
         self.update_gt_state(all_objects, last_event)
 
-        # Get current goal from pddl problem file
-        with open(Configuration.PDDL_PROBLEM_PATH, 'r') as f:
-            data = [el.strip() for el in f.read().split("\n") if not el.strip().startswith(";")]
-            goal = re.findall(":goal.*","".join(data))[0]
-
-        goal_facts = sorted(re.findall("\([^()]*\)", goal))
+        # Get current goal facts from pddl problem
+        goal_facts = self.get_goal_facts()
         goal_objects = goal_facts[0]
         goal_facts = goal_facts[1:]
 
@@ -572,13 +563,8 @@ class Evaluator:
         # Update ground truth state
         self.update_gt_state(all_objects, last_event)
 
-        # Get current goal from pddl problem file
-        with open(Configuration.PDDL_PROBLEM_PATH, 'r') as f:
-            data = [el.strip() for el in f.read().split("\n") if not el.strip().startswith(";")]
-            goal = re.findall(":goal.*","".join(data))[0]
-            facts = re.findall(":init.*\(:goal","".join(data))[0]
-
-        goal_facts = sorted(re.findall("\([^()]*\)", goal))
+        # Get current goal facts from pddl problem
+        goal_facts = self.get_goal_facts()
         goal_objects = goal_facts[0]
         goal_facts = goal_facts[1:]
         goal_predicate_type = goal_facts[0].strip()[1:-1].split()[0]
@@ -0,0 +1,60 @@
+# Copyright (c) 2022, Leonardo Lamanna
+# All rights reserved.
+# This source code is licensed under the MIT-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+
+import pickle
+
+import torch
+
+
+# Neural network models and resources loaded by the current process, which are shared by all episodes
+RESOURCES = dict()
+
+
+def get_model(model_name, path, device, load_model):
+    """
+    Get a neural network model, which is loaded the first time it is required by the process.
+    :param model_name: model class name, which distinguishes models loaded from the same path (e.g. untrained ones)
+    :param path: model weights path
+    :param device: torch device the model is loaded onto
+    :param load_model: function without arguments which loads the model
+    :return: neural network model
+    """
+    key = (model_name, path, str(device))
+    if key not in RESOURCES:
+        RESOURCES[key] = load_model()
+    return RESOURCES[key]
+
+
+def get_pickle(path):
+    """
+    Get the object stored in a pickle file, which is loaded the first time it is required by the process. The returned
+    object is shared, hence it must not be modified.
+    :param path: pickle file path
+    :return: unpickled object
+    """
+    key = ('pickle', path)
+    if key not in RESOURCES:
+        with open(path, "rb") as f:
+            RESOURCES[key] = pickle.load(f)
+    return RESOURCES[key]
+
+
+def load_checkpoint(path, device):
+    """
+    Load the state dict of a model checkpoint. The checkpoint file is memory mapped rather than read at once, unless it
+    has been saved with the legacy torch serialization format.
+    :param path: checkpoint path
+    :param device: torch device the weights are loaded onto
+    :return: model state dict
+    """
+    try:
+        return torch.load(path, map_location=device, mmap=True)
+    except RuntimeError:
+        return torch.load(path, map_location=device)
+
+
+def clear():
+    RESOURCES.clear()
@@ -14,23 +14,38 @@ import numpy as np
 
 import Configuration
 from Utils import Logger
+from Utils.PddlProblem import PddlProblem
 
 np.random.seed(Configuration.RANDOM_SEED)
 random.seed(Configuration.RANDOM_SEED)
 
+# PDDL problem of the current episode, which is written to the problem file only before running the planner
+PDDL_PROBLEM = None
+
+
+def get_pddl_problem():
+    global PDDL_PROBLEM
+    if PDDL_PROBLEM is None:
+        PDDL_PROBLEM = PddlProblem(Configuration.PDDL_PROBLEM_PATH)
+    return PDDL_PROBLEM
+
+
+def write_pddl_problem():
+    get_pddl_problem().write()
+
 
 # Update PDDL state with max-score ones and consider only objects involved in the goal or objects related to goal ones.
 def update_pddl_state(objects, predicates, objects_counting, objects_scores):
 
-    inspected_objs = [pred.split('(')[1].strip()[:-1] for pred in predicates if pred.startswith("inspected")]
+    inspected_objs = [obj_ids[0] for obj_ids in predicates.get("inspected")]
 
     score_threshold = 0.2
 
     # Initialize filtered predicates (i.e. predicates involving goal objects) with all nullary ones.
     considered_goal_objs = []
-    holding_obj = [p for p in predicates if 'holding' in p]
+    holding_obj = predicates.get("holding")
     if len(holding_obj) > 0:
-        holding_obj = holding_obj[0].replace("holding(", "").strip()[:-1]
+        holding_obj = holding_obj[0][0]
     else:
         holding_obj = None
 
@@ -69,37 +84,16 @@ def update_pddl_state(objects, predicates, objects_counting, objects_scores):
 
     filtered_objs = [obj['id'] for obj_type in objects.keys() for obj in objects[obj_type]
                      if obj['id'] not in removed_objs]
-    filtered_preds = [pred for pred in predicates
-                      if set([el for el in pred.split('(')[1].strip()[:-1].split(',') if el.strip() != '']).issubset(set(filtered_objs))
-                      or len([el for el in pred.split('(')[1].strip()[:-1].split(',') if el.strip() != '']) == 0]
-
-    with open("./OGAMUS/Plan/PDDL/facts.pddl", "r") as f:
-        old_pddl_state = [el.strip() for el in f.read().split("\n") if el.strip() != '']
-        old_facts = re.findall(":init.*\(:goal", "".join(old_pddl_state))[0]
-
-        old_objs = [el for el in re.findall(":objects(.*?)\)", "++".join(old_pddl_state))[0].split("++") if el.strip() != ""]
-        old_state = "\n" + "\n".join(re.findall("\([^()]*\)", old_facts))
-
-        # Replace facts
-        new_facts = "\n" + "\n".join(sorted(["({} {})".format(p.strip().split("(")[0],
-                                                              " ".join(p.strip().split("(")[1][:-1].split(",")))
-                                             for p in filtered_preds]))
+    filtered_objs_set = set(filtered_objs)
+    filtered_preds = [(name, obj_ids) for name, obj_ids in predicates.items() if set(obj_ids).issubset(filtered_objs_set)]
 
-        if old_state!="\n":
-            new_pddl = "\n".join(old_pddl_state).replace(old_state, new_facts)
-        else:
-            new_pddl = "\n".join(old_pddl_state).replace("(:init", "(:init" + new_facts)
-
-        # Replace objects
-        new_objs = ["{} - {}".format(obj_id, obj_id.split('_')[0]) for obj_id in filtered_objs]
-
-        if len(old_objs) > 0:
-            new_pddl = new_pddl.replace("\n".join(old_objs), "\n".join(new_objs))
-        else:
-            new_pddl = new_pddl.replace("(:objects", "(:objects\n" + "\n".join(new_objs))
+    # Replace facts
+    new_facts = sorted(["({} {})".format(name, " ".join(obj_ids)) for name, obj_ids in filtered_preds])
+    get_pddl_problem().set_facts(new_facts)
 
-    with open("./OGAMUS/Plan/PDDL/facts.pddl", "w") as f:
-        f.write(new_pddl)
+    # Replace objects
+    new_objs = ["{} - {}".format(obj_id, obj_id.split('_')[0]) for obj_id in filtered_objs]
+    get_pddl_problem().set_objects(new_objs)
 
 
 def get_operator_effects(op_name):
@@ -275,22 +269,8 @@ def set_goal(goal):
 
     Configuration.GOAL_OBJECTS = [el.split()[0] for el in re.findall("\([^()]*\)", goal)[0][1:-1].split('-')[1:]]
 
-    # Update goal in PDDL problem file
-    with open("./OGAMUS/Plan/PDDL/facts.pddl", 'r') as f:
-        data = f.read().split("\n")
-        for i in range(len(data)):
-            row = data[i]
-
-            if row.strip().find("(:goal") != -1:
-                end_index = i + 1
-
-                if data[i].strip().startswith(")"):
-                    data[i] = ")\n(:goal \n(and \n{}) \n))".format(goal)
-                else:
-                    data[i] = "(:goal \n(and \n{}) \n))".format(goal)
-
-    with open("./OGAMUS/Plan/PDDL/facts.pddl", 'w') as f:
-        [f.write(el + "\n") for el in data[:end_index]]
+    # Update goal in PDDL problem
+    get_pddl_problem().set_goal(goal)
 
 
     # # Copy problem file in result directory
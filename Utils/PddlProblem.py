@@ -0,0 +1,76 @@
+# Copyright (c) 2022, Leonardo Lamanna
+# All rights reserved.
+# This source code is licensed under the MIT-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+
+import os
+import re
+
+
+class PddlProblem:
+    """
+    PDDL problem kept in memory, i.e., objects, initial state facts and goal. The problem file is written only when
+    its content has changed since the last time it has been written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.name = 'ithor'
+        self.domain = 'ithor'
+        self.objects = []
+        self.facts = []
+        self.goal = ''
+
+        # Initialize the problem with the existing problem file, if any
+        if os.path.exists(path):
+            self.read()
+
+        self.dirty = True
+
+
+    def read(self):
+        with open(self.path, 'r') as f:
+            data = [el.strip() for el in f.read().split("\n") if el.strip() != '' and not el.strip().startswith(";")]
+
+        self.name = re.findall("\(problem ([^()]*)\)", "\n".join(data))[0].strip()
+        self.domain = re.findall("\(:domain ([^()]*)\)", "\n".join(data))[0].strip()
+        self.objects = [el for el in re.findall(":objects(.*?)\)", "++".join(data))[0].split("++") if el.strip() != ""]
+        self.facts = re.findall("\([^()]*\)", re.findall(":init.*\(:goal", "".join(data))[0])
+        self.goal = re.findall("\(:goal\s*\(and\s*(.*)\)\s*\)\)\s*$", "\n".join(data), re.S)[0].strip()
+
+
+    def set_objects(self, objects):
+        """
+        :param objects: list of typed objects, e.g. "apple_0 - apple"
+        """
+        if objects != self.objects:
+            self.objects = objects
+            self.dirty = True
+
+
+    def set_facts(self, facts):
+        """
+        :param facts: list of initial state facts, e.g. "(on apple_0 plate_1)"
+        """
+        if facts != self.facts:
+            self.facts = facts
+            self.dirty = True
+
+
+    def set_goal(self, goal):
+        if goal != self.goal:
+            self.goal = goal
+            self.dirty = True
+
+
+    def to_pddl(self):
+        return "(define (problem {})\n(:domain {})\n(:objects\n{}\n)\n(:init\n{}\n)\n(:goal\n(and\n{})\n))"\
+            .format(self.name, self.domain, "\n".join(self.objects), "\n".join(self.facts), self.goal)
+
+
+    def write(self):
+        if self.dirty:
+            with open(self.path, 'w') as f:
+                f.write(self.to_pddl())
+            self.dirty = False
@@ -4,6 +4,9 @@
 # LICENSE file in the root directory of this source tree.
 
 
+from collections import OrderedDict
+from functools import lru_cache
+
 import numpy as np
 
 import Configuration
@@ -15,8 +18,8 @@ def pixel_coord_np(width, height):
     Returns:
         Pixel coordinate:       [3, width * height]
     """
-    x = np.linspace(0, width - 1, width).astype(np.int)
-    y = np.linspace(0, height - 1, height).astype(np.int)
+    x = np.linspace(0, width - 1, width).astype(int)
+    y = np.linspace(0, height - 1, height).astype(int)
     [x, y] = np.meshgrid(x, y)
     return np.vstack((x.flatten(), y.flatten(), np.ones_like(x.flatten())))
 
@@ -41,17 +44,103 @@ def intrinsic_from_fov(height, width, fov=Configuration.FOV):
                      [0., 0., 0., 1.]])
 
 
-def get_point_cloud(depth_matrix):
-    # Get intrinsic parameters
-    height, width = depth_matrix.shape
-    K = intrinsic_from_fov(height, width, Configuration.FOV)
-    K_inv = np.linalg.inv(K)
+class CameraModel:
+    """
+    Pinhole camera model of the agent, which caches the back-projection rays of all pixels and, for each agent
+    orientation, the rays rotated into the map reference system. Back-projecting a depth view is then a single product
+    between the rays and the depth values. Agent orientations are rounded to a fixed angle step, hence the cache is not
+    filled by orientations which differ by floating point noise only.
+    """
 
-    # Get pixel coordinates
-    pixel_coords = pixel_coord_np(width, height)  # [3, npoints]
+    def __init__(self, width, height, fov, max_cached_orientations=128, orientation_step=0.1):
+        self.width = width
+        self.height = height
+
+        # Back-projection rays of pixels in camera reference system, i.e., K_inv @ [col, row, 1]
+        K_inv = np.linalg.inv(intrinsic_from_fov(height, width, fov))
+        self.pixel_rays = (K_inv[:3, :3] @ pixel_coord_np(width, height)).astype(np.float32)  # [3, npoints]
+
+        # Back-projection rays in agent reference system, i.e., with x-axis to the right, y-axis forward and z-axis
+        # upwards
+        self.agent_rays = np.stack((self.pixel_rays[0], self.pixel_rays[2], -self.pixel_rays[1]))
+
+        # Least recently used rotation matrices and rotated rays of agent orientations
+        self.max_cached_orientations = max_cached_orientations
+        self.orientation_step = orientation_step
+        self.rotations = OrderedDict()
+        self.rotated_rays = OrderedDict()
+
+
+    def get_rotation(self, yaw, roll):
+        """
+        Get the rotation matrix of an agent orientation
+        Args:
+            yaw, roll:       In degrees
+        Returns:
+            R:          [3, 3]
+        """
+        key = (yaw, roll)
+        if key not in self.rotations:
+            self.rotations[key] = rotation_from_euler(yaw=np.deg2rad(yaw), roll=np.deg2rad(roll))[:3, :3]
+            if len(self.rotations) > self.max_cached_orientations:
+                self.rotations.popitem(last=False)
+        self.rotations.move_to_end(key)
+        return self.rotations[key]
+
+
+    def get_orientation_key(self, yaw, roll):
+        """
+        Round an agent orientation to the orientation step
+        Args:
+            yaw, roll:       In degrees
+        Returns:
+            (yaw, roll):     In degrees, rounded to the orientation step
+        """
+        step = self.orientation_step
+        return round(round(yaw / step) * step % 360, 6), round(round(roll / step) * step, 6)
+
+
+    def get_rays(self, yaw, roll):
+        """
+        Get the back-projection rays of pixels rotated according to an agent orientation
+        Args:
+            yaw, roll:       In degrees
+        Returns:
+            Rays:       [3, npoints]
+        """
+        key = self.get_orientation_key(yaw, roll)
+        if key not in self.rotated_rays:
+            self.rotated_rays[key] = (self.get_rotation(*key) @ self.agent_rays).astype(np.float32)
+            if len(self.rotated_rays) > self.max_cached_orientations:
+                self.rotated_rays.popitem(last=False)
+        self.rotated_rays.move_to_end(key)
+        return self.rotated_rays[key]
+
+
+    def get_points(self, depth_matrix, yaw=0, roll=0, max_depth=None):
+        """
+        Back-project a depth view into points centered in the agent position, rotated according to the agent
+        orientation. Points farther than the maximum depth and NaN depth points are discarded.
+        Returns:
+            Points:       [npoints, 3]
+        """
+        depth = depth_matrix.ravel()
+        rays = self.get_rays(yaw, roll)
+        if max_depth is not None:
+            valid = depth <= max_depth
+            rays, depth = rays[:, valid], depth[valid]
+        return (rays * depth).T
+
+
+@lru_cache(maxsize=None)
+def get_camera_model(width, height, fov):
+    return CameraModel(width, height, fov)
 
+
+def get_point_cloud(depth_matrix):
     # Apply back-projection: K_inv @ pixels * depth
-    cam_coords = K_inv[:3, :3] @ pixel_coords * depth_matrix.flatten()
+    height, width = depth_matrix.shape
+    cam_coords = get_camera_model(width, height, Configuration.FOV).pixel_rays * depth_matrix.ravel()
 
     return cam_coords
 
@@ -87,162 +176,85 @@ def rotation_from_euler(roll=0, pitch=0, yaw=0):
     return R
 
 
-def get_xyz_point_from_depth(depth_matrix, angle, cam_angle, pos):#, min_row, min_col, max_row, max_col):
+def get_xyz_point_from_depth(depth_matrix, angle, cam_angle, pos):
 
         angle = (angle - 90) % 360  # rescale angle according to simulator reference system
 
-        # Limit points to 150m in the z-direction for visualisation
-        # cam_coords = cam_coords[:, np.where(cam_coords[2] <= 150)[0]]
-        x, y, z = get_point_cloud(depth_matrix)
-
-        # flip the y-axis to positive upwards
-        cam_coords = np.array((x, -y, z))
-
+        # Back-project depth points within the agent view horizon, rotated according to agent orientation
+        height, width = depth_matrix.shape
+        occupancy_points = get_camera_model(width, height, Configuration.FOV).get_points(depth_matrix, angle, cam_angle,
+                                                                                         max_depth=30)
 
-        # Filter cam coordinates according to agent view horizon
-        cam_coords = cam_coords[:, np.where(cam_coords[2] <= 30)[0]]
-
-        # Filter cam coordinates according to agent height
-        # cam_coords = cam_coords[:, np.where(cam_coords[1] <= 0)[0]]
-        # cam_coords = cam_coords[:, np.where(cam_coords[1] >= -1.5)[0]]
-
-        # # Visualize 3D point cloud
-        # pcd_cam = o3d.geometry.PointCloud()
-        # pcd_cam.points = o3d.utility.Vector3dVector(cam_coords.T[:, :3])
-        # # Flip it, otherwise the pointcloud will be upside down
-        # pcd_cam.transform([[1, 0, 0, 0], [0, -1, 0, 0], [0, 0, -1, 0], [0, 0, 0, 1]])
-        # o3d.visualization.draw_geometries([pcd_cam])
-
-        # Do top view projection
-        # Get camera points
-        x, y, z = cam_coords
-
-        # Get agent depth view occupancy points
-        occupancy_points = np.column_stack((x, z, y))
-        # rot_matrix = np.array(([np.cos(np.deg2rad(angle)), - np.sin(np.deg2rad(angle))],
-        #                        [np.sin(np.deg2rad(angle)), np.cos(np.deg2rad(angle))]))
-        rot_matrix = rotation_from_euler(yaw=np.deg2rad(angle), roll=np.deg2rad(cam_angle))
-
-        # Rotate agent view according to agent orientation
-        occupancy_points = np.dot(occupancy_points, rot_matrix.T[:3, :3])
-
-        # Add agent offset position to agent view
-        # occupancy_points[:, 0] += pos['x']
-        # occupancy_points[:, 1] += pos['y']
-        # considered_x = np.reshape(occupancy_points[:, 0], (224, 224))[min_col:max_col]
-        # considered_y = np.reshape(occupancy_points[:, 0], (224, 224))[min_row:max_row]
-
-        # x, y = np.mean(occupancy_points[:, 0]), np.mean(occupancy_points[:, 1])
-
-        obj_x = [x + pos['x'] for x in occupancy_points[:, 0] if x != np.nan]
-        obj_y = [y + pos['y'] for y in occupancy_points[:, 1] if y != np.nan]
-        obj_z = [z + pos['z'] for z in occupancy_points[:, 2] if z != np.nan]
-        x, y, z = np.mean(obj_x), np.mean(obj_y), np.mean(obj_z)
+        # Average the points and add agent offset position
+        x, y, z = np.mean(occupancy_points, axis=0, dtype=np.float64) + np.array([pos['x'], pos['y'], pos['z']])
 
         return x, y, z
 
 
-def get_xy_point_from_depth(depth_matrix, angle, pos):#, min_row, min_col, max_row, max_col):
-
-        angle = (angle - 90) % 360  # rescale angle according to simulator reference system
-
-        # Limit points to 150m in the z-direction for visualisation
-        # cam_coords = cam_coords[:, np.where(cam_coords[2] <= 150)[0]]
-        x, y, z = get_point_cloud(depth_matrix)
-
-        # flip the y-axis to positive upwards
-        cam_coords = np.array((x, -y, z))
-
-
-        # Filter cam coordinates according to agent view horizon
-        cam_coords = cam_coords[:, np.where(cam_coords[2] <= 30)[0]]
-
-        # Filter cam coordinates according to agent height
-        # cam_coords = cam_coords[:, np.where(cam_coords[1] <= 0)[0]]
-        # cam_coords = cam_coords[:, np.where(cam_coords[1] >= -1.5)[0]]
-
-        # # Visualize 3D point cloud
-        # pcd_cam = o3d.geometry.PointCloud()
-        # pcd_cam.points = o3d.utility.Vector3dVector(cam_coords.T[:, :3])
-        # # Flip it, otherwise the pointcloud will be upside down
-        # pcd_cam.transform([[1, 0, 0, 0], [0, -1, 0, 0], [0, 0, -1, 0], [0, 0, 0, 1]])
-        # o3d.visualization.draw_geometries([pcd_cam])
-
-        # Do top view projection
-        # Get camera points
-        x, y, z = cam_coords
-
-        # Get agent depth view occupancy points
-        occupancy_points = np.column_stack((x, z))
-        rot_matrix = np.array(([np.cos(np.deg2rad(angle)), - np.sin(np.deg2rad(angle))],
-                               [np.sin(np.deg2rad(angle)), np.cos(np.deg2rad(angle))]))
+def get_xyz_points_from_depth_rois(depth_matrix, rois, angle, cam_angle, pos):
+    """
+    Get the map position of several objects, by averaging the back-projected depth points within each object region,
+    as done by get_xyz_point_from_depth() with the depth points out of the object region set to NaN.
+    :param depth_matrix: depth view in meters
+    :param rois: list of object regions (min_row, max_row, min_col, max_col)
+    :param angle: agent rotation in degrees
+    :param cam_angle: agent camera inclination in degrees
+    :param pos: agent position
+    :return: array of objects positions [n_objects, 3], NaN for objects without valid depth points
+    """
+    if len(rois) == 0:
+        return np.zeros((0, 3))
 
-        # Rotate agent view according to agent orientation
-        occupancy_points = np.dot(occupancy_points, rot_matrix.T)
+    angle = (angle - 90) % 360  # rescale angle according to simulator reference system
 
-        # Add agent offset position to agent view
-        # occupancy_points[:, 0] += pos['x']
-        # occupancy_points[:, 1] += pos['y']
-        # considered_x = np.reshape(occupancy_points[:, 0], (224, 224))[min_col:max_col]
-        # considered_y = np.reshape(occupancy_points[:, 0], (224, 224))[min_row:max_row]
+    # Back-project the depth points of all object regions, with the rays rotated according to agent orientation
+    height, width = depth_matrix.shape
+    rays = get_camera_model(width, height, Configuration.FOV).get_rays(angle, cam_angle).reshape(3, height, width)
+    roi_depths = [depth_matrix[min_row:max_row, min_col:max_col].ravel() for min_row, max_row, min_col, max_col in rois]
+    roi_rays = [rays[:, min_row:max_row, min_col:max_col].reshape(3, -1) for min_row, max_row, min_col, max_col in rois]
+    depth = np.concatenate(roi_depths)
+    obj_idx = np.repeat(np.arange(len(rois)), [len(roi_depth) for roi_depth in roi_depths])
 
-        # x, y = np.mean(occupancy_points[:, 0]), np.mean(occupancy_points[:, 1])
+    # Filter depth points according to agent view horizon, this also discards NaN depth points
+    valid = depth <= 30
+    occupancy_points = (np.concatenate(roi_rays, axis=1)[:, valid] * depth[valid]).T
+    obj_idx = obj_idx[valid]
 
-        obj_x = [x + pos['x'] for x in occupancy_points[:, 0] if x != np.nan]
-        obj_y = [y + pos['y'] for y in occupancy_points[:, 1] if y != np.nan]
-        x, y = np.mean(obj_x), np.mean(obj_y)
+    # Average the points of each object and add agent offset position
+    counts = np.bincount(obj_idx, minlength=len(rois)).astype(float)
+    counts[counts == 0] = np.nan
+    objs_xyz = np.column_stack([np.bincount(obj_idx, weights=occupancy_points[:, i], minlength=len(rois)) / counts
+                                for i in range(3)])
+    objs_xyz += np.array([pos['x'], pos['y'], pos['z']])
 
-        return x, y
+    return objs_xyz
 
 
-def get_xz_point_from_depth(depth_matrix, angle, pos):#, min_row, min_col, max_row, max_col):
+def get_xy_point_from_depth(depth_matrix, angle, pos):
 
         angle = (angle - 90) % 360  # rescale angle according to simulator reference system
 
-        # Limit points to 150m in the z-direction for visualisation
-        # cam_coords = cam_coords[:, np.where(cam_coords[2] <= 150)[0]]
-        x, y, z = get_point_cloud(depth_matrix)
-
-        # flip the y-axis to positive upwards
-        cam_coords = np.array((x, -y, z))
+        # Back-project depth points within the agent view horizon, rotated according to agent orientation
+        height, width = depth_matrix.shape
+        occupancy_points = get_camera_model(width, height, Configuration.FOV).get_points(depth_matrix, angle,
+                                                                                         max_depth=30)
 
+        # Average the points and add agent offset position
+        x, y = np.mean(occupancy_points[:, :2], axis=0, dtype=np.float64) + np.array([pos['x'], pos['y']])
 
-        # Filter cam coordinates according to agent view horizon
-        cam_coords = cam_coords[:, np.where(cam_coords[2] <= 20)[0]]  # ???
-
-        # Filter cam coordinates according to agent height
-        # cam_coords = cam_coords[:, np.where(cam_coords[1] <= 0)[0]]
-        cam_coords = cam_coords[:, np.where(cam_coords[1] >= -1.5)[0]]
-
-        # # Visualize 3D point cloud
-        # pcd_cam = o3d.geometry.PointCloud()
-        # pcd_cam.points = o3d.utility.Vector3dVector(cam_coords.T[:, :3])
-        # # Flip it, otherwise the pointcloud will be upside down
-        # pcd_cam.transform([[1, 0, 0, 0], [0, -1, 0, 0], [0, 0, -1, 0], [0, 0, 0, 1]])
-        # o3d.visualization.draw_geometries([pcd_cam])
-
-        # Do top view projection
-        # Get camera points
-        x, y, z = cam_coords
+        return x, y
 
-        # Get agent depth view occupancy points
-        occupancy_points = np.column_stack((x, y))
-        # rot_matrix = np.array(([np.cos(np.deg2rad(angle)), - np.sin(np.deg2rad(angle))],
-        #                        [np.sin(np.deg2rad(angle)), np.cos(np.deg2rad(angle))]))
 
-        # Rotate agent view according to agent orientation
-        # occupancy_points = np.dot(occupancy_points, rot_matrix.T)
+def get_xz_point_from_depth(depth_matrix, angle, pos):
 
-        # Add agent offset position to agent view
-        # occupancy_points[:, 0] += pos['x']
-        # occupancy_points[:, 1] += pos['y']
-        # considered_x = np.reshape(occupancy_points[:, 0], (224, 224))[min_col:max_col]
-        # considered_y = np.reshape(occupancy_points[:, 0], (224, 224))[min_row:max_row]
+        # Back-project depth points within the agent view horizon, without rotating them
+        height, width = depth_matrix.shape
+        occupancy_points = get_camera_model(width, height, Configuration.FOV).get_points(depth_matrix, max_depth=20)
 
-        # x, y = np.mean(occupancy_points[:, 0]), np.mean(occupancy_points[:, 1])
+        # Filter points according to agent height
+        occupancy_points = occupancy_points[occupancy_points[:, 2] >= -1.5]
 
-        obj_x = [x + pos['x'] for x in occupancy_points[:, 0] if x != np.nan]
-        obj_z = [z + pos['z'] for z in occupancy_points[:, 1] if z != np.nan]
-        x, z = np.mean(obj_x), np.mean(obj_z)
+        # Average the points and add agent offset position
+        x, z = np.mean(occupancy_points[:, [0, 2]], axis=0, dtype=np.float64) + np.array([pos['x'], pos['z']])
 
         return x, z
@@ -0,0 +1,125 @@
+# Copyright (c) 2022, Leonardo Lamanna
+# All rights reserved.
+# This source code is licensed under the MIT-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import torch
+from ai2thor.controller import Controller
+
+import Configuration
+from OGAMUS.Agent import Agent
+from Utils import Logger, PddlParser
+
+
+class RoundTripCounter:
+    """
+    Wrap the controller step method to count the simulator round trips and the time spent waiting for the simulator.
+    """
+
+    def __init__(self, controller):
+        self.controller_step = controller.step
+        self.round_trips = 0
+        self.seconds = 0.
+        controller.step = self.step
+
+    def step(self, *args, **kwargs):
+        start = time.perf_counter()
+        event = self.controller_step(*args, **kwargs)
+        self.seconds += time.perf_counter() - start
+        self.round_trips += 1
+        return event
+
+
+def run_episode(controller, episode_data, frame_sync, n_iter):
+
+    Configuration.FRAME_SYNC = frame_sync
+
+    # Run each episode with the same random seed, hence the agent executes the same actions
+    np.random.seed(Configuration.RANDOM_SEED)
+    random.seed(Configuration.RANDOM_SEED)
+    torch.manual_seed(Configuration.RANDOM_SEED)
+
+    controller.reset(scene=episode_data['scene'])
+    PddlParser.set_goal(episode_data['goal'])
+
+    counter = RoundTripCounter(controller)
+    start = time.perf_counter()
+    Agent(scene=episode_data['scene'], position=episode_data['agent_position'],
+          init_rotation=episode_data['initial_orientation'], init_horizon=episode_data['initial_horizon'],
+          shortest_path=episode_data['shortest_path'], controller=controller).run(n_iter)
+    seconds = time.perf_counter() - start
+    controller.step = counter.controller_step
+
+    return counter.round_trips, counter.seconds, seconds
+
+
+def main():
+
+    args_parser = argparse.ArgumentParser(description="Count the simulator round trips of an object goal navigation "
+                                                      "episode with and without the frame sync step.")
+    args_parser.add_argument('-e', '--episode', help="Episode index in the iTHOR object goal navigation dataset",
+                             type=int, default=0)
+    args_parser.add_argument('-n', '--n_iter', help="Number of agent steps", type=int, default=200)
+    args = args_parser.parse_args()
+
+    Configuration.TASK = Configuration.TASK_OGN_ITHOR
+    Configuration.DATASET = 'test_set_{}'.format(Configuration.TASK)
+    Configuration.MAX_ITER = args.n_iter
+    Configuration.PRINT_IMAGES = 0
+    Configuration.VERBOSE = 0
+
+    dataset = json.load(open(os.path.join(Configuration.DATASET_DIR, '{}.json'.format(Configuration.DATASET)), 'r'))
+    episode_data = dataset[args.episode]
+
+    shutil.copyfile("OGAMUS/Plan/PDDL/domain_ogn.pddl", "OGAMUS/Plan/PDDL/domain.pddl")
+
+    controller = Controller(renderDepthImage=Configuration.RENDER_DEPTH_IMG,
+                            renderObjectImage=True,
+                            visibilityDistance=Configuration.VISIBILITY_DISTANCE,
+                            gridSize=Configuration.MOVE_STEP,
+                            rotateStepDegrees=Configuration.ROTATION_STEP,
+                            scene=episode_data['scene'],
+                            continuousMode=True,
+                            snapToGrid=False,
+                            width=Configuration.FRAME_WIDTH,
+                            height=Configuration.FRAME_HEIGHT,
+                            fieldOfView=Configuration.FOV,
+                            agentMode='default')
+
+    results = {}
+    with tempfile.TemporaryDirectory() as log_dir:
+        Logger.LOG_DIR_PATH = log_dir
+        Logger.LOG_FILE = open(os.path.join(log_dir, "log.txt"), "w")
+        for frame_sync in [True, False]:
+            results[frame_sync] = run_episode(controller, episode_data, frame_sync, args.n_iter)
+        Logger.LOG_FILE.close()
+
+    controller.stop()
+
+    for frame_sync in [True, False]:
+        round_trips, simulator_seconds, seconds = results[frame_sync]
+        print("Frame sync {}: {} round trips, {:.2f} seconds in simulator steps, {:.2f} seconds per episode"
+              .format('on' if frame_sync else 'off', round_trips, simulator_seconds, seconds))
+
+    saved_seconds = results[True][2] - results[False][2]
+    print("Saved round trips: {}".format(results[True][0] - results[False][0]))
+    print("Saved wall-clock time: {:.2f} seconds per episode, {:.2f} seconds per 200 steps"
+          .format(saved_seconds, saved_seconds / args.n_iter * 200))
+
+    if results[False][0] >= results[True][0]:
+        print("Error: disabling the frame sync step does not reduce the simulator round trips.")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
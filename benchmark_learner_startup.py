@@ -0,0 +1,46 @@
+# Copyright (c) 2022, Leonardo Lamanna
+# All rights reserved.
+# This source code is licensed under the MIT-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+
+import argparse
+import time
+
+import Configuration
+from OGAMUS.Learn.Learner import Learner
+from Utils import ModelRegistry
+
+
+def time_learner():
+    start = time.perf_counter()
+    Learner()
+    return time.perf_counter() - start
+
+
+def main():
+
+    args_parser = argparse.ArgumentParser(description="Measure the cold and warm start time of the agent learner, i.e., "
+                                                      "the construction time of its neural network models.")
+    args_parser.add_argument('-t', '--task', help="Agent task, which selects the object detector",
+                             choices=[Configuration.TASK_OGN_ITHOR, Configuration.TASK_OGN_ROBOTHOR],
+                             default=Configuration.TASK_OGN_ITHOR)
+    args_parser.add_argument('-n', '--n_runs', help="Number of cold starts", type=int, default=3)
+    args = args_parser.parse_args()
+
+    Configuration.TASK = args.task
+
+    # A cold start loads all models, while a warm start reuses the models loaded by the process
+    cold_seconds = []
+    warm_seconds = []
+    for _ in range(args.n_runs):
+        ModelRegistry.clear()
+        cold_seconds.append(time_learner())
+        warm_seconds.append(time_learner())
+
+    print("Learner cold start: {}".format(", ".join(["{:.2f}s".format(s) for s in cold_seconds])))
+    print("Learner warm start: {}".format(", ".join(["{:.2f}s".format(s) for s in warm_seconds])))
+
+
+if __name__ == "__main__":
+    main()
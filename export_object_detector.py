@@ -0,0 +1,165 @@
+# Copyright (c) 2022, Leonardo Lamanna
+# All rights reserved.
+# This source code is licensed under the MIT-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+
+import argparse
+import copy
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+import Configuration
+from OGAMUS.Learn.NNModels import DetectorBackend
+from OGAMUS.Learn.NNModels.FasterRCNN import FasterRCNN
+from OGAMUS.Learn.NNModels.FasterRCNN_robothor_ogn import FasterRCNN_robothor_ogn
+
+
+DETECTORS = {
+    'ithor': (FasterRCNN, Configuration.OBJ_DETECTOR_PATH),
+    'robothor_ogn': (FasterRCNN_robothor_ogn, Configuration.OBJ_DETECTOR_ROBOTHOR_OGN_PATH)
+}
+
+
+def load_detector(detector_class, backend, quantized):
+    Configuration.OBJ_DETECTOR_BACKEND = backend
+    Configuration.OBJ_DETECTOR_QUANTIZED = quantized
+    return detector_class()
+
+
+def get_iou(box, boxes):
+    x_min = np.maximum(box[0], boxes[:, 0])
+    y_min = np.maximum(box[1], boxes[:, 1])
+    x_max = np.minimum(box[2], boxes[:, 2])
+    y_max = np.minimum(box[3], boxes[:, 3])
+    intersection = np.clip(x_max - x_min, 0, None) * np.clip(y_max - y_min, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / (area + areas - intersection)
+
+
+def match_predictions(reference_pred, pred, iou_thrsh):
+    """
+    Match the predictions of the exported detector with the ones of the eager detector.
+    :param reference_pred: eager detector predictions
+    :param pred: exported detector predictions
+    :param iou_thrsh: minimum IoU between two matching bboxes with the same label
+    :return: number of matched reference predictions and absolute score differences of matched predictions
+    """
+    matched = 0
+    score_diffs = []
+    unmatched = np.ones(len(pred['boxes']), dtype=bool)
+    for box, label, score in zip(reference_pred['boxes'], reference_pred['labels'], reference_pred['scores']):
+        candidates = np.where(unmatched & (pred['labels'] == label))[0]
+        if len(candidates) == 0:
+            continue
+        ious = get_iou(box, pred['boxes'][candidates])
+        best = np.argmax(ious)
+        if ious[best] >= iou_thrsh:
+            matched += 1
+            unmatched[candidates[best]] = False
+            score_diffs.append(abs(score - pred['scores'][candidates[best]]))
+    return matched, score_diffs
+
+
+def benchmark(detector, frames):
+
+    # Warm up the detector, e.g. TorchScript optimizes the graph during the first runs
+    for rgb_img in frames[:2]:
+        detector.predict(rgb_img)
+
+    predictions = []
+    seconds = []
+    for rgb_img in frames:
+        start = time.perf_counter()
+        predictions.append(detector.predict(rgb_img))
+        seconds.append(time.perf_counter() - start)
+    return predictions, np.array(seconds)
+
+
+def main():
+
+    args_parser = argparse.ArgumentParser(description="Export the fine-tuned object detector to TorchScript or ONNX "
+                                                      "Runtime, then check its accuracy parity and latency against "
+                                                      "the eager model on a set of saved frames.")
+    args_parser.add_argument('-d', '--detector', help="Object detector to export", choices=list(DETECTORS.keys()),
+                             default='ithor')
+    args_parser.add_argument('-b', '--backend', help="Exported model backend",
+                             choices=[Configuration.OBJ_DETECTOR_BACKEND_TORCHSCRIPT,
+                                      Configuration.OBJ_DETECTOR_BACKEND_ONNX],
+                             default=Configuration.OBJ_DETECTOR_BACKEND_TORCHSCRIPT)
+    args_parser.add_argument('-q', '--quantized', help="Quantize the linear layers to int8", action='store_true')
+    args_parser.add_argument('-c', '--channels_last', help="Store the TorchScript model convolutional weights in "
+                                                           "channels last memory format", action='store_true')
+    args_parser.add_argument('-f', '--frames', help="Directory of saved RGB frames used to check the exported model, "
+                                                    "e.g. the agent camera view images in a log directory")
+    args_parser.add_argument('--iou', help="Minimum IoU between matching predictions", type=float, default=0.8)
+    args_parser.add_argument('--min_parity', help="Minimum fraction of eager model predictions matched by the "
+                                                  "exported model", type=float, default=0.95)
+    args = args_parser.parse_args()
+
+    Configuration.PRINT_OBJS_PREDICTIONS = 0
+    Configuration.SHARED_BACKBONE = False
+
+    detector_class, checkpoint_path = DETECTORS[args.detector]
+    eager_detector = load_detector(detector_class, Configuration.OBJ_DETECTOR_BACKEND_EAGER, False)
+
+    # Export the eager model
+    path = DetectorBackend.get_backend_path(checkpoint_path, args.backend, args.quantized)
+    if args.backend == Configuration.OBJ_DETECTOR_BACKEND_TORCHSCRIPT:
+        DetectorBackend.export_torchscript(copy.deepcopy(eager_detector.model), path, args.quantized,
+                                           args.channels_last)
+    else:
+        DetectorBackend.export_onnx(copy.deepcopy(eager_detector.model), path, args.quantized)
+    print("Exported object detector: {}".format(path))
+
+    if args.frames is None:
+        return
+
+    frames = [np.array(Image.open(os.path.join(args.frames, f)).convert('RGB'))
+              for f in sorted(os.listdir(args.frames)) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+    if len(frames) == 0:
+        print("Error: no frames found in {}".format(args.frames))
+        exit(1)
+
+    exported_detector = load_detector(detector_class, args.backend, args.quantized)
+
+    eager_preds, eager_seconds = benchmark(eager_detector, frames)
+    exported_preds, exported_seconds = benchmark(exported_detector, frames)
+
+    # Accuracy parity
+    tot_preds = sum([len(pred['boxes']) for pred in eager_preds])
+    tot_exported_preds = sum([len(pred['boxes']) for pred in exported_preds])
+    tot_matched = 0
+    score_diffs = []
+    for eager_pred, exported_pred in zip(eager_preds, exported_preds):
+        matched, frame_score_diffs = match_predictions(eager_pred, exported_pred, args.iou)
+        tot_matched += matched
+        score_diffs.extend(frame_score_diffs)
+    parity = tot_matched / tot_preds if tot_preds > 0 else 1.
+
+    print("Frames: {}".format(len(frames)))
+    print("Eager predictions: {}, exported predictions: {}, matched predictions: {} ({:.2f}%)"
+          .format(tot_preds, tot_exported_preds, tot_matched, parity * 100))
+    if len(score_diffs) > 0:
+        print("Matched predictions score difference: mean {:.4f}, max {:.4f}"
+              .format(np.mean(score_diffs), np.max(score_diffs)))
+
+    # Latency
+    print("Eager latency: mean {:.1f} ms, median {:.1f} ms"
+          .format(eager_seconds.mean() * 1000, np.median(eager_seconds) * 1000))
+    print("Exported latency: mean {:.1f} ms, median {:.1f} ms"
+          .format(exported_seconds.mean() * 1000, np.median(exported_seconds) * 1000))
+    print("Speedup: {:.2f}x".format(eager_seconds.mean() / exported_seconds.mean()))
+
+    if parity < args.min_parity:
+        print("Error: the exported object detector matches {:.2f}% of the eager model predictions, which is lower "
+              "than {:.2f}%".format(parity * 100, args.min_parity * 100))
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -260,6 +260,7 @@ def main(controller):
                   shortest_path=shortest_path, controller=controller).run()
 
         # Copy problem file in result directory
+        PddlParser.write_pddl_problem()
         shutil.copyfile("OGAMUS/Plan/PDDL/facts.pddl", os.path.join(Logger.LOG_DIR_PATH, "facts_{}.pddl".format(scene)))
 
     return controller
@@ -0,0 +1,161 @@
+# Copyright (c) 2022, Leonardo Lamanna
+# All rights reserved.
+# This source code is licensed under the MIT-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+
+import argparse
+import random
+
+import numpy as np
+import torch
+from ai2thor.controller import Controller
+
+import Configuration
+from OGAMUS.Learn.NNModels.FasterRCNN import FasterRCNN
+from OGAMUS.Learn.NNModels.FasterRCNN_robothor_ogn import FasterRCNN_robothor_ogn
+from OGAMUS.Learn.NNModels.OpenPredicateClassifierROINN import OpenPredicateClassifierROINN
+
+
+DETECTORS = {
+    'ithor': FasterRCNN,
+    'robothor_ogn': FasterRCNN_robothor_ogn
+}
+
+# iTHOR training scenes, i.e., the first 20 scenes of each room type
+TRAIN_SCENES = ["FloorPlan{}".format(room_type * 100 + i) for room_type in [0, 2, 3, 4] for i in range(1, 21)]
+
+
+def set_random_view(controller, reachable_positions):
+
+    position = random.choice(reachable_positions)
+    rotation = random.choice(range(0, 360, Configuration.ROTATION_STEP))
+    horizon = random.choice(range(-30, Configuration.MAX_CAM_ANGLE + 1, 30))
+    return controller.step(action="Teleport", position=position, rotation=dict(x=0, y=rotation, z=0),
+                           horizon=horizon, standing=True)
+
+
+def get_openable_objects(event):
+    return [obj for obj in event.metadata['objects'] if obj['openable'] and obj['visible']
+            and obj['objectType'].lower() in Configuration.OPENABLE_OBJS
+            and obj['objectId'] in event.instance_detections2D]
+
+
+def collect_samples(controller, detector, head, scenes, n_views):
+    """
+    Collect the pooled object detector features of openable objects, labelled with their ground truth open state.
+    Visible openable objects are randomly opened or closed in each view, hence both open states are observed.
+    :return: features of shape (n_samples, 4096) and labels of shape (n_samples, 1)
+    """
+    features, labels = [], []
+    for scene in scenes:
+        controller.reset(scene=scene)
+        reachable_positions = controller.step(action="GetReachablePositions").metadata["actionReturn"]
+
+        for _ in range(n_views):
+            event = set_random_view(controller, reachable_positions)
+            for obj in get_openable_objects(event):
+                action = 'OpenObject' if random.random() < 0.5 else 'CloseObject'
+                event = controller.step(action=action, objectId=obj['objectId'], forceAction=True)
+
+            openable_objs = get_openable_objects(event)
+            if len(openable_objs) == 0:
+                continue
+
+            # Pool the detector backbone features within the object bboxes, as done by the scene classifier
+            rgb_img = event.frame
+            img_features, img_size = detector.get_features(rgb_img)
+            boxes_scale = [img_size[1] / rgb_img.shape[1], img_size[0] / rgb_img.shape[0]] * 2
+            boxes = torch.tensor([event.instance_detections2D[obj['objectId']] for obj in openable_objs],
+                                 dtype=torch.float32)
+            boxes = boxes * torch.tensor(boxes_scale, dtype=torch.float32)
+            with torch.no_grad():
+                pooled = head.roi_pool(img_features, [boxes.to(img_features['0'].device)], [img_size])
+            features.append(torch.flatten(pooled, start_dim=1).cpu())
+            labels.extend([[float(obj['isOpen'])] for obj in openable_objs])
+
+        print("Scene {}: {} samples".format(scene, len(labels)))
+
+    return torch.cat(features), torch.tensor(labels, dtype=torch.float32)
+
+
+def get_accuracy(head, features, labels):
+    with torch.no_grad():
+        y_pred = torch.sigmoid(head.fc1(features)) >= Configuration.OPEN_CLASSIFIER_THRSH
+    return (y_pred.float() == labels).float().mean().item()
+
+
+def main():
+
+    args_parser = argparse.ArgumentParser(description="Train the open predicate classifier head on the object "
+                                                      "detector backbone features (see Configuration.SHARED_BACKBONE) "
+                                                      "with ground truth open states collected in iTHOR scenes.")
+    args_parser.add_argument('-d', '--detector', help="Object detector whose backbone features are classified",
+                             choices=list(DETECTORS.keys()), default='ithor')
+    args_parser.add_argument('-s', '--scenes', help="Training scenes", nargs='+', default=TRAIN_SCENES)
+    args_parser.add_argument('-v', '--views', help="Random agent views per scene", type=int, default=100)
+    args_parser.add_argument('-e', '--epochs', help="Training epochs", type=int, default=50)
+    args_parser.add_argument('--lr', help="Learning rate", type=float, default=1e-3)
+    args_parser.add_argument('--batch_size', help="Batch size", type=int, default=256)
+    args_parser.add_argument('--val_split', help="Fraction of samples used for validation", type=float, default=0.2)
+    args_parser.add_argument('-o', '--output', help="Output model path", default=Configuration.OPEN_CLASSIFIER_ROI_PATH)
+    args = args_parser.parse_args()
+
+    np.random.seed(Configuration.RANDOM_SEED)
+    random.seed(Configuration.RANDOM_SEED)
+    torch.manual_seed(Configuration.RANDOM_SEED)
+
+    # The detector keeps its backbone features, which are computed with the eager model
+    Configuration.PRINT_OBJS_PREDICTIONS = 0
+    Configuration.SHARED_BACKBONE = True
+    Configuration.OBJ_DETECTOR_BACKEND = Configuration.OBJ_DETECTOR_BACKEND_EAGER
+    detector = DETECTORS[args.detector]()
+    head = OpenPredicateClassifierROINN().to(detector.device)
+
+    controller = Controller(renderInstanceSegmentation=True,
+                            visibilityDistance=Configuration.VISIBILITY_DISTANCE,
+                            gridSize=Configuration.MOVE_STEP,
+                            rotateStepDegrees=Configuration.ROTATION_STEP,
+                            scene=args.scenes[0],
+                            width=Configuration.FRAME_WIDTH,
+                            height=Configuration.FRAME_HEIGHT,
+                            fieldOfView=Configuration.FOV,
+                            agentMode='default')
+    features, labels = collect_samples(controller, detector, head, args.scenes, args.views)
+    controller.stop()
+
+    if len(labels) == 0:
+        print("Error: no openable objects observed in the training scenes")
+        exit(1)
+
+    # Only the linear layer is trained, the features are pooled once
+    head = head.cpu()
+    indices = torch.randperm(len(labels))
+    n_val = int(len(labels) * args.val_split)
+    val_idx, train_idx = indices[:n_val], indices[n_val:]
+    print("Training samples: {}, validation samples: {}, open samples: {:.2f}%"
+          .format(len(train_idx), len(val_idx), labels.mean().item() * 100))
+
+    optimizer = torch.optim.Adam(head.fc1.parameters(), lr=args.lr)
+    criterion = torch.nn.BCEWithLogitsLoss()
+    for epoch in range(args.epochs):
+        head.train()
+        epoch_loss = 0.
+        for batch in torch.split(train_idx[torch.randperm(len(train_idx))], args.batch_size):
+            optimizer.zero_grad()
+            loss = criterion(head.fc1(features[batch]), labels[batch])
+            loss.backward()
+            optimizer.step()
+            epoch_loss += loss.item() * len(batch)
+
+        head.eval()
+        val_accuracy = get_accuracy(head, features[val_idx], labels[val_idx]) if n_val > 0 else float('nan')
+        print("Epoch {}: training loss {:.4f}, validation accuracy {:.2f}%"
+              .format(epoch, epoch_loss / len(train_idx), val_accuracy * 100))
+
+    torch.save(head.state_dict(), args.output)
+    print("Saved open predicate classifier head: {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()